@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+from Scoring_Engine import FEATURES
+
+GROUP_KEYS = ['Department', 'Role']
+COUNT_KEYS = GROUP_KEYS + ['Behavior_Label', 'Access_Anomaly_Flag']
+BEHAVIOR_LABELS = ['Normal', 'Suspicious', 'Critical']
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+def _count_table(df):
+    return df.groupby(COUNT_KEYS, observed=True, sort=False).size()
+
+
+def _feature_groups(df):
+    features = df[FEATURES].astype(np.float64)
+    return features.groupby([df[key] for key in GROUP_KEYS], observed=True, sort=False)
+
+
+def _sum_table(df):
+    groups = _feature_groups(df)
+    sums = groups.sum()
+    sums['Rows'] = groups.size()
+    return sums
+
+
+def _quantile_table(df):
+    return _feature_groups(df).quantile(QUANTILES).sort_index()
+
+
+class BehaviourAggregates:
+    """
+    Precomputed counts, feature sums and feature quantiles per Department
+    and Role, so department pages never filter the full behaviour frame.
+
+    Counts are kept per Department x Role x Behavior_Label x
+    Access_Anomaly_Flag. Counts and sums are additive and can be updated
+    with just the new rows; quantiles are recomputed for the groups the
+    new rows touch.
+    """
+
+    def __init__(self, counts, sums, quantiles, department_ids):
+        self.counts = counts
+        self.sums = sums
+        self.quantiles = quantiles
+        self.department_ids = department_ids
+        self._summarise()
+
+    @classmethod
+    def build(cls, employee_df):
+        department_ids = {
+            department: np.asarray(pd.unique(ids), dtype=object)
+            for department, ids in employee_df.groupby('Department', observed=True, sort=False)['Employee_ID']
+        }
+        return cls(_count_table(employee_df), _sum_table(employee_df), _quantile_table(employee_df), department_ids)
+
+    def _summarise(self):
+        """Roll the fine-grained tables up to one small row per department."""
+        by_label = self.counts.groupby(['Department', 'Behavior_Label'], observed=True).sum().unstack(fill_value=0)
+        by_label = by_label.reindex(columns=BEHAVIOR_LABELS, fill_value=0)
+
+        flags = self.counts.index.get_level_values('Access_Anomaly_Flag').to_numpy(dtype=np.int64)
+        anomalies = (self.counts * flags).groupby(level='Department', observed=True).sum()
+
+        summary = by_label.copy()
+        summary['Total'] = self.counts.groupby(level='Department', observed=True).sum()
+        summary['Anomalies'] = anomalies
+        summary['Anomaly_Rate'] = summary['Anomalies'] / summary['Total'] * 100
+        self.department_summary = summary
+
+        department_sums = self.sums.groupby(level='Department', observed=True).sum()
+        self.department_means = department_sums[FEATURES].div(department_sums['Rows'], axis=0)
+
+    def departments(self):
+        """Departments in the order they first appear in the data."""
+        return list(self.department_ids)
+
+    def employee_ids(self, department):
+        return self.department_ids.get(department, np.array([], dtype=object))
+
+    def department_kpis(self, department):
+        """Return the department's totals, label counts and anomaly rate."""
+        row = self.department_summary.loc[department]
+        kpis = {label: int(row[label]) for label in BEHAVIOR_LABELS}
+        kpis['Total'] = int(row['Total'])
+        kpis['Anomalies'] = int(row['Anomalies'])
+        kpis['Anomaly_Rate'] = float(row['Anomaly_Rate'])
+        return kpis
+
+    def department_feature_means(self, department):
+        return self.department_means.loc[department]
+
+    def role_feature_means(self, department, role):
+        row = self.sums.loc[(department, role)]
+        return row[FEATURES] / row['Rows']
+
+    def role_feature_quantiles(self, department, role):
+        """Return a quantile x feature table for one Department and Role."""
+        return self.quantiles.loc[(department, role)]
+
+    def _blend_quantiles(self, chunk_quantiles, chunk_rows):
+        """Row-weighted mix of the stored and the new rows' quantiles per group."""
+        groups = chunk_quantiles.index.droplevel(-1)
+        old_rows = self.sums['Rows'].reindex(groups, fill_value=0).to_numpy()[:, None]
+        new_rows = chunk_rows.reindex(groups).to_numpy()[:, None]
+        old_values = self.quantiles.reindex(chunk_quantiles.index).fillna(0.0).to_numpy()
+        blended = (old_values * old_rows + chunk_quantiles.to_numpy() * new_rows) / (old_rows + new_rows)
+        return pd.DataFrame(blended, index=chunk_quantiles.index, columns=chunk_quantiles.columns)
+
+    def add_rows(self, new_rows, employee_df=None):
+        """
+        Fold newly arrived rows into the aggregates. `employee_df` is the
+        full frame including the new rows; it is only read for the groups
+        the new rows belong to, to refresh their quantiles exactly. Without
+        it (streaming ingestion) the touched groups' quantiles are blended
+        with the new rows' quantiles, weighted by row counts.
+        """
+        if new_rows.empty:
+            return
+
+        new_sums = _sum_table(new_rows)
+        if employee_df is not None:
+            touched = new_rows[GROUP_KEYS].drop_duplicates()
+            refreshed = _quantile_table(employee_df.merge(touched, on=GROUP_KEYS, how='inner'))
+        else:
+            refreshed = self._blend_quantiles(_quantile_table(new_rows), new_sums['Rows'])
+
+        self.counts = self.counts.add(_count_table(new_rows), fill_value=0).astype(np.int64)
+        self.sums = self.sums.add(new_sums, fill_value=0)
+        untouched = ~self.quantiles.index.droplevel(-1).isin(refreshed.index.droplevel(-1))
+        self.quantiles = pd.concat([self.quantiles[untouched], refreshed]).sort_index()
+
+        for department, ids in new_rows.groupby('Department', observed=True, sort=False)['Employee_ID']:
+            existing = self.department_ids.get(department, np.array([], dtype=object))
+            self.department_ids[department] = pd.unique(np.concatenate([existing, ids.to_numpy(dtype=object)]))
+
+        self._summarise()
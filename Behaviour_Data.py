@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import numpy as np
+import pandas as pd
+
+DATA_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\Employee_Behaviour.csv"
+
+# Bump whenever the on-disk layout changes so old snapshots get rebuilt
+SNAPSHOT_VERSION = 3
+MANIFEST_NAME = 'manifest.json'
+
+# The export is day-first, so formats are explicit rather than inferred
+TIMESTAMP_FORMATS = {
+    'Login_Timestamp': '%d-%m-%Y %H:%M',
+    'Logout_Timestamp': '%d-%m-%Y %H:%M',
+    'File_Access_Timestamp': '%d-%m-%Y'
+}
+
+# Target representation per column. 'category' stores codes plus the
+# distinct values; 'unsigned' and 'integer' downcast to the smallest
+# integer type that holds the column's range (float columns stay float).
+SCHEMA = {
+    'Employee_ID': 'category',
+    'Department': 'category',
+    'Role': 'category',
+    'Behavior_Label': 'category',
+    'File_Access_Frequency': 'unsigned',
+    'Access_Anomaly_Flag': 'unsigned',
+    'Suspicious_Activity_Flag': 'unsigned',
+    'Idle_Time': 'unsigned',
+    'VPN_Usage': 'bool',
+    'Latitude': 'float32',
+    'Longitude': 'float32',
+    'Login_Hour': 'unsigned',
+    'Logout_Hour': 'unsigned'
+}
+
+
+def snapshot_dir(csv_path):
+    """Return the snapshot directory that sits next to the source CSV."""
+    root, _ = os.path.splitext(csv_path)
+    return root + '.snapshot'
+
+
+def file_fingerprint(path, chunk_size=1 << 20, limit=None):
+    """
+    Hash a file in fixed-size blocks so large logs never sit in memory.
+    With `limit`, only the first `limit` bytes are hashed.
+    """
+    digest = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            block = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return digest.hexdigest()
+
+
+def data_fingerprint(csv_path=DATA_PATH):
+    """Return the CSV content hash, reusing the snapshot manifest when it is current."""
+    manifest = _read_manifest(snapshot_dir(csv_path))
+    if snapshot_is_current(csv_path, manifest):
+        return manifest['source_sha256']
+    return file_fingerprint(csv_path)
+
+
+def _read_manifest(directory):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(directory, manifest):
+    path = os.path.join(directory, MANIFEST_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _source_state(csv_path):
+    stat = os.stat(csv_path)
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def snapshot_is_current(csv_path, manifest=None):
+    """
+    Check whether the snapshot still matches the source CSV.
+
+    The size and mtime are compared first since they are free. If only the
+    mtime moved (file touched or copied) the content hash decides, and the
+    manifest is refreshed so the next check is cheap again.
+    """
+    directory = snapshot_dir(csv_path)
+    if manifest is None:
+        manifest = _read_manifest(directory)
+    if not manifest or manifest.get('version') != SNAPSHOT_VERSION:
+        return False
+
+    state = _source_state(csv_path)
+    if manifest['source_size'] != state['source_size']:
+        return False
+    if manifest['source_mtime_ns'] == state['source_mtime_ns']:
+        return True
+    if manifest['source_sha256'] != file_fingerprint(csv_path):
+        return False
+
+    manifest.update(state)
+    _write_manifest(directory, manifest)
+    return True
+
+
+def write_snapshot(df, csv_path, state=None):
+    """
+    Write a frame as a columnar snapshot of .npy files next to the CSV.
+
+    Numeric, boolean and datetime columns are stored as-is. Categorical and
+    string columns are stored as integer codes plus a fixed-width array of
+    unique values, so every column can be memory-mapped on load.
+
+    `state` is the source size and mtime taken before the CSV was read, so
+    rows appended while it was being parsed are not claimed as covered.
+    """
+    directory = snapshot_dir(csv_path)
+    state = state or _source_state(csv_path)
+    build_dir = f'{directory}.tmp-{os.getpid()}'
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(build_dir, f'{i}.codes.npy'), series.cat.codes.to_numpy())
+            np.save(os.path.join(build_dir, f'{i}.values.npy'), np.asarray(series.cat.categories, dtype=str))
+            columns.append({'name': name, 'kind': 'category'})
+        elif not (pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series)
+                or pd.api.types.is_datetime64_any_dtype(series)):
+            codes, uniques = pd.factorize(series)
+            np.save(os.path.join(build_dir, f'{i}.codes.npy'), codes.astype(np.int32))
+            np.save(os.path.join(build_dir, f'{i}.values.npy'), np.asarray(uniques, dtype=str))
+            columns.append({'name': name, 'kind': 'string'})
+        else:
+            np.save(os.path.join(build_dir, f'{i}.npy'), series.to_numpy())
+            columns.append({'name': name, 'kind': 'numeric'})
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'source_sha256': file_fingerprint(csv_path, limit=state['source_size']),
+        'rows': len(df),
+        'columns': columns,
+    }
+    manifest.update(state)
+    _write_manifest(build_dir, manifest)
+
+    # Swap the finished build into place; readers only trust a manifest
+    # that was written after all column files
+    old_dir = f'{directory}.old-{os.getpid()}'
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(build_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return manifest
+
+
+def read_snapshot(csv_path, manifest=None):
+    """Load a snapshot, memory-mapping every column file."""
+    directory = snapshot_dir(csv_path)
+    if manifest is None:
+        manifest = _read_manifest(directory)
+
+    data = {}
+    for i, column in enumerate(manifest['columns']):
+        if column['kind'] == 'category':
+            codes = np.load(os.path.join(directory, f'{i}.codes.npy'), mmap_mode='r')
+            values = np.load(os.path.join(directory, f'{i}.values.npy'))
+            data[column['name']] = pd.Categorical.from_codes(codes, categories=values.astype(object))
+        elif column['kind'] == 'string':
+            codes = np.load(os.path.join(directory, f'{i}.codes.npy'), mmap_mode='r')
+            values = np.load(os.path.join(directory, f'{i}.values.npy'))
+            # Code -1 marks a missing value and picks the trailing NaN
+            lookup = np.append(values.astype(object), np.nan)
+            data[column['name']] = lookup.take(codes)
+        else:
+            data[column['name']] = np.load(os.path.join(directory, f'{i}.npy'), mmap_mode='r')
+
+    employee_df = pd.DataFrame(data, copy=False)
+    # Lets tail readers continue from exactly the bytes this frame covers
+    employee_df.attrs['source_size'] = manifest['source_size']
+    return employee_df
+
+
+def parse_timestamps(employee_df):
+    """
+    Parse every timestamp column in one vectorized pass with its explicit
+    format, and derive Login_Hour, Logout_Hour and Session_Minutes.
+    """
+    for column, fmt in TIMESTAMP_FORMATS.items():
+        if column in employee_df and not pd.api.types.is_datetime64_any_dtype(employee_df[column]):
+            employee_df[column] = pd.to_datetime(employee_df[column], format=fmt)
+
+    login = employee_df['Login_Timestamp']
+    logout = employee_df['Logout_Timestamp']
+    employee_df['Login_Hour'] = login.dt.hour
+    employee_df['Logout_Hour'] = logout.dt.hour
+    employee_df['Session_Minutes'] = (logout - login).dt.total_seconds() / 60
+    return employee_df
+
+
+def apply_schema(employee_df, schema=SCHEMA):
+    """Convert the columns named in the schema to their compact dtypes."""
+    for column, kind in schema.items():
+        if column not in employee_df:
+            continue
+        if kind == 'category':
+            employee_df[column] = employee_df[column].astype('category')
+        elif kind in ('unsigned', 'integer'):
+            employee_df[column] = pd.to_numeric(employee_df[column], downcast=kind)
+        else:
+            employee_df[column] = employee_df[column].astype(kind)
+    return employee_df
+
+
+def memory_report(before_df, after_df):
+    """Per-column memory in bytes of two versions of a frame, with totals."""
+    report = pd.DataFrame({
+        'Before': before_df.memory_usage(deep=True, index=False),
+        'After': after_df.memory_usage(deep=True, index=False),
+        'Before_Dtype': before_df.dtypes.astype(str),
+        'After_Dtype': after_df.dtypes.astype(str)
+    })
+    report.loc['Total'] = [report['Before'].sum(), report['After'].sum(), '', '']
+    return report
+
+
+def load_behaviour_data(csv_path=DATA_PATH):
+    """
+    Load the behaviour log, parsing the CSV only when its snapshot is stale.
+    """
+    manifest = _read_manifest(snapshot_dir(csv_path))
+    if snapshot_is_current(csv_path, manifest):
+        return read_snapshot(csv_path, manifest)
+
+    state = _source_state(csv_path)
+    employee_df = apply_schema(parse_timestamps(pd.read_csv(csv_path)))
+    manifest = write_snapshot(employee_df, csv_path, state)
+    return read_snapshot(csv_path, manifest)
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else DATA_PATH
+    raw_df = parse_timestamps(pd.read_csv(csv_path))
+    report = memory_report(raw_df, apply_schema(raw_df.copy()))
+    print(report.to_string())
+    total = report.loc['Total']
+    print(f"{total['Before'] / 2**20:.2f} MB -> {total['After'] / 2**20:.2f} MB")
@@ -1,26 +1,282 @@
+import os
 import streamlit as st 
 import pandas as pd
 import numpy as np
-import altair as alt
-from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import load_model
-from vega_datasets import data
-from scipy.interpolate import make_interp_spline
-import matplotlib.pyplot as plt
+from Lazy_Imports import lazy_import
+from Behaviour_Data import load_behaviour_data, data_fingerprint, file_fingerprint
+from Scoring_Engine import PopulationScores, score_population, squared_errors
+from Parallel_Scoring import score_population_parallel
+from Model_Bundle import load_model_bundle, fit_model_bundle, calibrate_threshold
+from Numpy_Autoencoder import load_scoring_model
+from Resource_Manager import ResourceManager
+from Aggregates import BehaviourAggregates
+from Employee_Store import EmployeeStore
+from Tail_Follower import LiveFollower
+from SQL_Store import StoreScores, load_sql_store, score_store
+from Incremental_Training import BackgroundRetrainer
+from Model_Registry import ModelRegistry, registry_index_path
+from Peer_Index import PeerIndex
+from Travel_Detector import detect_travel
+from Geofence_Index import GeofenceChecker, load_geofences
+from Quantile_Sketch import save_sketches, sketch_path
+from Streaming_Ingest import StreamingIngest
+
+DATA_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\Employee_Behaviour.csv"
+MODEL_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\autoencoder_model.keras"
+SQL_STORE_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\Employee_Behaviour.sqlite3"
+# Approved areas per department; without this file no geofence check is shown
+GEOFENCE_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\approved_areas.json"
+
+# 'snapshot' keeps everything in memory; 'sqlite' serves the selectors,
+# department KPIs, employee sessions and their scores from one SQLite store
+# shared by every dashboard process, without loading the whole table;
+# 'stream' reads the CSV once in chunks and keeps only the aggregates,
+# error sketches and each employee's latest sessions, so no history
+DATA_BACKEND = 'snapshot'
+
+# How far back the session trend on the employee page reaches
+TREND_DAYS = 90
+
+# 'numpy' runs the exported weights without TensorFlow, 'keras' loads the full model
+SCORING_BACKEND = 'numpy'
+
+# Worker processes for full-population scoring; 1 scores in this process
+SCORING_WORKERS = 1
+
+# Bytes of per-(Department, Role) model weights to keep loaded from the
+# registry next to MODEL_PATH; None scores everyone with the global model
+MODEL_REGISTRY_BUDGET = None
+
+# How many behavioural peers the employee page lists
+PEER_COUNT = 5
+
+# Charts are drawn after the header and KPIs, so altair loads on first use
+alt = lazy_import('altair')
 
 def load_data():
-    employee_df = pd.read_csv(r"C:\Users\Nitya\Downloads\SentinelSecure\Employee_Behaviour.csv")
+    employee_df = load_behaviour_data(DATA_PATH)
     return employee_df
 
 def load_autoencoder_model():
-    autoencoder = load_model(r"C:\Users\Nitya\Downloads\SentinelSecure\autoencoder_model.keras")
+    autoencoder = load_scoring_model(MODEL_PATH, SCORING_BACKEND)
     return autoencoder
 
-def validate_employee_behavior(employee_id, employee_df, autoencoder):
+def load_population_scores(employee_store, autoencoder):
+    """
+    Score the whole population with the scaler and threshold saved next to
+    the model. The scaler is only fitted when no bundle exists yet or the
+    model file has changed, and the threshold is recalibrated over the
+    population once per data version.
+    """
+    employee_df = employee_store.frame
+    fingerprint = data_fingerprint(DATA_PATH)
+
+    bundle = load_model_bundle(MODEL_PATH)
+    if bundle is None or not bundle.matches_model(MODEL_PATH):
+        bundle = fit_model_bundle(employee_df, autoencoder, MODEL_PATH, fingerprint)
+
+    # The global threshold is calibrated on global-model errors, even when group models score the rows
+    if MODEL_REGISTRY_BUDGET is None or not bundle.is_calibrated_for(fingerprint):
+        if SCORING_WORKERS > 1:
+            population_scores = score_population_parallel(
+                employee_df, bundle, MODEL_PATH, SCORING_WORKERS, SCORING_BACKEND, index=employee_store.index
+            )
+        else:
+            population_scores = score_population(employee_df, autoencoder, bundle, index=employee_store.index)
+        if not bundle.is_calibrated_for(fingerprint):
+            threshold = calibrate_threshold(bundle, employee_df, population_scores.errors, fingerprint, MODEL_PATH)
+            population_scores.set_threshold(threshold)
+
+    if MODEL_REGISTRY_BUDGET is not None:
+        if SCORING_WORKERS > 1:
+            population_scores = score_population_parallel(
+                employee_df, bundle, MODEL_PATH, SCORING_WORKERS, index=employee_store.index,
+                registry_budget=MODEL_REGISTRY_BUDGET
+            )
+        else:
+            population_scores = ModelRegistry(MODEL_PATH, MODEL_REGISTRY_BUDGET).score_population(
+                employee_df, employee_store.index
+            )
+    # Distance and time from each session to the employee's previous one, for impossible travel
+    population_scores.set_travel(*detect_travel(employee_df, employee_store.index))
+    # Per-department feature contributions, read by the explanation panel on every rerun
+    population_scores.track_contributions(employee_df['Department'])
+    # Error sketches next to the model, for merging with those of the scoring service
+    save_sketches(population_scores.sketches, sketch_path(MODEL_PATH))
+    return population_scores
+
+def load_store_scores(sql_store, autoencoder):
+    """
+    Bring the scores kept in the SQLite store up to date with the model and
+    data, scoring the stored sessions chunk by chunk so the table is never
+    loaded whole; processes opened later find them current and only read
+    them. Rows are scored as in load_population_scores, but a model bundle
+    must already exist.
+    """
+    fingerprint = data_fingerprint(DATA_PATH)
+    bundle = load_model_bundle(MODEL_PATH)
+    if bundle is None or not bundle.matches_model(MODEL_PATH):
+        raise ValueError(f"No model bundle matching {MODEL_PATH}; train a model first")
+    registry = None if MODEL_REGISTRY_BUDGET is None else ModelRegistry(MODEL_PATH, MODEL_REGISTRY_BUDGET)
+    scored_with = f'{bundle.model_fingerprint} {fingerprint}'
+    if registry is not None and os.path.exists(registry_index_path(MODEL_PATH)):
+        scored_with += ' ' + file_fingerprint(registry_index_path(MODEL_PATH))
+    if sql_store.scored_with() == scored_with and bundle.is_calibrated_for(fingerprint):
+        return StoreScores(sql_store, bundle)
+
+    if registry is None or not bundle.is_calibrated_for(fingerprint):
+        scores = score_store(sql_store, autoencoder, bundle)
+        if not bundle.is_calibrated_for(fingerprint):
+            # The global threshold is calibrated on global-model errors, even when group models score the rows
+            errors, _, logins, _, _ = scores
+            calibrate_threshold(bundle, pd.DataFrame({'Login_Timestamp': logins}), errors, fingerprint, MODEL_PATH)
+    if registry is not None:
+        scores = score_store(sql_store, autoencoder, bundle, registry)
+    errors, thresholds, _, sketches, contributions = scores
+    save_sketches(sketches, sketch_path(MODEL_PATH))
+    sql_store.save_scores(errors, bundle.threshold, thresholds, scored_with, sketches, contributions)
+    return StoreScores(sql_store, bundle)
+
+def load_stream_ingest(autoencoder):
+    """
+    Stream the CSV through StreamingIngest chunk by chunk, scoring every
+    session as in load_population_scores; the rows are dropped once folded
+    in. A model bundle must already exist, since calibrating a threshold
+    needs every error at once.
+    """
+    bundle = load_model_bundle(MODEL_PATH)
+    if bundle is None or not bundle.matches_model(MODEL_PATH):
+        raise ValueError(f"No model bundle matching {MODEL_PATH}; train a model first")
+    registry = None if MODEL_REGISTRY_BUDGET is None else ModelRegistry(MODEL_PATH, MODEL_REGISTRY_BUDGET)
+    ingest = StreamingIngest(autoencoder, bundle, registry=registry).ingest(DATA_PATH)
+    save_sketches(ingest.sketches, sketch_path(MODEL_PATH))
+    return ingest
+
+def load_shared_resources(follow=False):
+    """
+    Return the indexed data, model, population scores and department
+    aggregates shared by every session in this process. Each session holds
+    a lease on them for its lifetime, and they are rebuilt when the CSV or
+    model file changes.
+
+    With `follow`, rows appended to the CSV are folded into them in place
+    by a shared LiveFollower instead of triggering a full rebuild.
+
+    When DATA_BACKEND is 'sqlite' the SQLite store stands in for the data
+    and the aggregates, and StoreScores for the population scores; when it
+    is 'stream' the StreamingIngest stands in for the data and the scores.
+    """
+    manager = ResourceManager.get_instance()
+    manager.register('employee_store', lambda: EmployeeStore(load_data()), [DATA_PATH])
+    manager.register('autoencoder', load_autoencoder_model, [MODEL_PATH])
+    manager.register(
+        'population_scores',
+        lambda: load_population_scores(manager.get('employee_store'), manager.get('autoencoder')),
+        [DATA_PATH, MODEL_PATH, registry_index_path(MODEL_PATH)]
+    )
+    manager.register('aggregates', lambda: BehaviourAggregates.build(manager.get('employee_store').frame), [DATA_PATH])
+    manager.register('tail_follower', lambda: LiveFollower(manager, DATA_PATH))
+    manager.register('sql_store', lambda: load_sql_store(DATA_PATH, SQL_STORE_PATH), [DATA_PATH])
+    manager.register(
+        'store_scores',
+        lambda: load_store_scores(manager.get('sql_store'), manager.get('autoencoder')),
+        [DATA_PATH, MODEL_PATH, registry_index_path(MODEL_PATH)]
+    )
+    manager.register(
+        'stream_ingest',
+        lambda: load_stream_ingest(manager.get('autoencoder')),
+        [DATA_PATH, MODEL_PATH, registry_index_path(MODEL_PATH)]
+    )
+    manager.register('stream_aggregates', lambda: manager.get('stream_ingest').aggregates, [DATA_PATH])
+    if DATA_BACKEND == 'sqlite':
+        names = ('sql_store', 'autoencoder', 'store_scores', 'sql_store')
+    elif DATA_BACKEND == 'stream':
+        names = ('stream_ingest', 'autoencoder', 'stream_ingest', 'stream_aggregates')
+    else:
+        names = ('employee_store', 'autoencoder', 'population_scores', 'aggregates')
+
+    if 'resource_leases' not in st.session_state:
+        st.session_state.resource_leases = {name: manager.acquire(name) for name in dict.fromkeys(names)}
+    leases = st.session_state.resource_leases
+
+    follower = None
+    if follow:
+        if 'tail_follower' not in leases:
+            leases['tail_follower'] = manager.acquire('tail_follower')
+        follower = leases['tail_follower'].value
+        # Fold in the latest appends before the data is read, so they are not
+        # mistaken for a changed file and reloaded in full
+        follower.poll()
+    elif 'tail_follower' in leases:
+        leases.pop('tail_follower').release()
+
+    resources = tuple(leases[name].value for name in names)
+    if follower is not None and not follower.is_following(resources[0], resources[2], resources[3]):
+        # The data was reloaded in full; follow the new copy from the next run
+        manager.invalidate('tail_follower')
+    return resources
+
+def get_retrainer():
+    """Return the process-wide background retrainer that fine-tunes the shared model."""
+    manager = ResourceManager.get_instance()
+    manager.register('retrainer', lambda: BackgroundRetrainer(manager, DATA_PATH, MODEL_PATH, SCORING_BACKEND))
+    return manager.get('retrainer')
+
+def get_peer_index(employee_store, population_scores):
+    """
+    Return the process-wide nearest-peer index, brought up to date with
+    the store: appended sessions are folded in, a reloaded store or model
+    rebuilds it.
+    """
+    manager = ResourceManager.get_instance()
+    manager.register('peer_index', PeerIndex)
+    peer_index = manager.get('peer_index')
+    peer_index.sync(employee_store, population_scores.bundle)
+    return peer_index
+
+def get_geofence_checker(employee_store=None):
+    """
+    Return the process-wide approved-area classification of every session,
+    reloaded when the geofence file changes and extended with appended rows.
+    Without an EmployeeStore, sessions are checked one at a time.
+    """
+    manager = ResourceManager.get_instance()
+    manager.register('geofences', lambda: GeofenceChecker(load_geofences(GEOFENCE_PATH)), [GEOFENCE_PATH])
+    checker = manager.get('geofences')
+    if employee_store is not None:
+        checker.sync(employee_store)
+    return checker
+
+def get_model_registry():
+    """Return the process-wide registry of per-(Department, Role) models."""
+    manager = ResourceManager.get_instance()
+    manager.register('model_registry', lambda: ModelRegistry(MODEL_PATH, MODEL_REGISTRY_BUDGET),
+                     [MODEL_PATH, registry_index_path(MODEL_PATH)])
+    return manager.get('model_registry')
+
+def explain_session(session, autoencoder, bundle):
+    """
+    Rank every feature of a one-session frame by its share of the session's
+    squared error, scoring it on the spot, for backends that keep no
+    per-feature errors. With MODEL_REGISTRY_BUDGET the session's group
+    model explains it, as it scored it.
+    """
+    if MODEL_REGISTRY_BUDGET is not None:
+        autoencoder, bundle = get_model_registry().get(session['Department'].iloc[0], session['Role'].iloc[0])
+    terms = squared_errors(bundle.transform_frame(session), autoencoder)
+    scores = PopulationScores(session['Employee_ID'], terms.mean(axis=1), bundle.threshold, bundle=bundle, terms=terms)
+    return scores.explain(session['Employee_ID'].iloc[0], k=len(bundle.features))
+
+def validate_employee_behavior(employee_id, employee_store, population_scores):
     """
     Function to validate an employee's behavior based on reconstructed error 
     from an autoencoder model.
 
+    Reconstruction errors and anomaly flags are read from the precomputed
+    population scores, so no model call happens here. Employees can have
+    many sessions; the latest one is validated, including whether it was
+    reached from the previous session faster than travel allows.
+
     Behavior_Label categories:
     - Suspicious:
         * Idle_Time: Higher than average but not excessive.
@@ -35,51 +291,37 @@ def validate_employee_behavior(employee_id, employee_df, autoencoder):
         * Work_Duration: Extremely short or excessively long hours without justification.
         * Latitude/Longitude: Geolocation inconsistent with approved areas or sudden location changes.
     """
-    features = ['Work_Duration', 'Idle_Time', 'File_Access_Frequency', 'VPN_Usage', 'Latitude', 'Longitude']
-    X = employee_df[features]
-
-    # Scale features
-    scaler = MinMaxScaler()
-    X_scaled = scaler.fit_transform(X)
-
-    # Filter data for specific employee
-    employee_data = employee_df[employee_df['Employee_ID'] == employee_id]
+    # Look up the employee's precomputed score
+    score = population_scores.lookup(employee_id)
 
     # Handle case where employee data is not found
-    if employee_data.empty:
+    if score is None:
         return None
 
-    # Scale features for the selected employee
-    employee_features = employee_data[features]
-    employee_scaled = scaler.transform(employee_features)
-
-    # Predict and calculate reconstruction error
-    reconstructed_employee = autoencoder.predict(employee_scaled)
-    mse = np.mean(np.power(employee_scaled - reconstructed_employee, 2), axis=1)
-    
-    # Calculate anomaly threshold
-    threshold = np.percentile(mse, 95)
-    anomaly_flag = mse > threshold
+    employee_data = employee_store.row(employee_id)
 
     # Extract behavior label
-    behavior_label = employee_data['Behavior_Label'].iloc[0]
+    behavior_label = employee_data['Behavior_Label']
 
     # Build result dictionary
     result = {
         'Employee_ID': employee_id,
-        'Department': employee_data['Department'].iloc[0],
-        'Role': employee_data['Role'].iloc[0],
+        'Department': employee_data['Department'],
+        'Role': employee_data['Role'],
         'Behavior_Label': behavior_label,
-        'Work_Duration': employee_data['Work_Duration'].iloc[0],
-        'Idle_Time': employee_data['Idle_Time'].iloc[0],
-        'File_Access_Frequency': employee_data['File_Access_Frequency'].iloc[0],
-        'VPN_Usage': employee_data['VPN_Usage'].iloc[0],
-        'Reconstruction_Error': mse[0],
-        'Is_Anomaly': bool(anomaly_flag[0]),
-        'Login_Timestamp': employee_data['Login_Timestamp'].iloc[0],
-        'Logout_Timestamp': employee_data['Logout_Timestamp'].iloc[0],
-        'Latitude': employee_data['Latitude'].iloc[0],
-        'Longitude': employee_data['Longitude'].iloc[0]
+        'Work_Duration': employee_data['Work_Duration'],
+        'Idle_Time': employee_data['Idle_Time'],
+        'File_Access_Frequency': employee_data['File_Access_Frequency'],
+        'VPN_Usage': employee_data['VPN_Usage'],
+        'Reconstruction_Error': score['Reconstruction_Error'],
+        'Is_Anomaly': score['Is_Anomaly'],
+        'Login_Timestamp': employee_data['Login_Timestamp'],
+        'Logout_Timestamp': employee_data['Logout_Timestamp'],
+        'Latitude': employee_data['Latitude'],
+        'Longitude': employee_data['Longitude'],
+        'Impossible_Travel': score.get('Impossible_Travel', False),
+        'Travel_Km': score.get('Travel_Km'),
+        'Travel_Hours': score.get('Travel_Hours')
     }
 
     return result
@@ -89,11 +331,9 @@ def create_peak_hours_chart(employee_data):
     """
     Create an enhanced peak hours activity chart with new theme colors and better aesthetics
     """
-    # Data preparation
-    employee_data['Login_Timestamp'] = pd.to_datetime(employee_data['Login_Timestamp'])
-    employee_data['Logout_Timestamp'] = pd.to_datetime(employee_data['Logout_Timestamp'])
-    login_hour = employee_data['Login_Timestamp'].dt.hour.iloc[0]
-    logout_hour = employee_data['Logout_Timestamp'].dt.hour.iloc[0]
+    # Data preparation (hours are derived once at load time)
+    login_hour = int(employee_data['Login_Hour'].iloc[0])
+    logout_hour = int(employee_data['Logout_Hour'].iloc[0])
 
     # Calculate activity data
     hours_data = pd.DataFrame({
@@ -253,12 +493,37 @@ def create_peak_hours_chart(employee_data):
 
 
 
-def create_behavior_comparison_chart(employee_data, department_data, features):
+def create_session_trend_chart(trend_df, threshold):
+    """
+    Plot the reconstruction error of each session over time, with anomalous
+    sessions highlighted and the anomaly threshold drawn as a rule.
+    """
+    trend_df = trend_df.assign(Status=np.where(trend_df['Is_Anomaly'], 'Anomalous', 'Normal'))
+    base = alt.Chart(trend_df).encode(
+        x=alt.X('Login_Timestamp:T', title='Login Time'),
+        y=alt.Y('Reconstruction_Error:Q', title='Reconstruction Error')
+    )
+    line = base.mark_line(color='#191970', strokeWidth=2)
+    points = base.mark_circle(size=70).encode(
+        color=alt.Color('Status:N',
+                        scale=alt.Scale(domain=['Normal', 'Anomalous'], range=['#87CEFB', '#dc3545']),
+                        legend=alt.Legend(title='', orient='top')),
+        tooltip=[
+            alt.Tooltip('Login_Timestamp:T', title='Login', format='%d %b %Y %H:%M'),
+            alt.Tooltip('Reconstruction_Error:Q', title='Error', format='.4f'),
+            alt.Tooltip('Status:N', title='Status')
+        ]
+    )
+    rule = alt.Chart(pd.DataFrame({'Threshold': [threshold]})).mark_rule(
+        color='#dc3545', strokeDash=[6, 4]
+    ).encode(y='Threshold:Q')
+
+    return (line + points + rule).properties(height=300).configure_view(stroke=None)
+
+def create_behavior_comparison_chart(employee_data, department_avg, features):
     """
     Create a grouped bar chart comparing employee metrics directly with department averages
     """
-    # Calculate department averages
-    department_avg = department_data[features].mean()
     employee_values = employee_data[features].iloc[0]
     
     # Create comparison dataframe in the desired format
@@ -328,17 +593,44 @@ def create_behavior_comparison_chart(employee_data, department_data, features):
     
     return chart
 
+def create_feature_contribution_chart(contribution_df):
+    """
+    Horizontal bars of each feature's share of the reconstruction error,
+    for the employee's latest session next to the average share over the
+    department's sessions.
+    Features keep the order they first appear in, i.e. the employee's ranking.
+    """
+    chart = alt.Chart(contribution_df).mark_bar(
+        cornerRadiusTopRight=5,
+        cornerRadiusBottomRight=5
+    ).encode(
+        y=alt.Y('Feature:N', title=None, sort=None),
+        x=alt.X('Share:Q', title='Share of Reconstruction Error', axis=alt.Axis(format='%')),
+        yOffset=alt.YOffset('Category:N'),
+        color=alt.Color('Category:N',
+                        scale=alt.Scale(domain=['Employee', 'Department Average'], range=['#dc3545', '#87CEFB']),
+                        legend=alt.Legend(title='', orient='top')),
+        tooltip=[
+            alt.Tooltip('Feature:N', title='Feature'),
+            alt.Tooltip('Category:N', title='Type'),
+            alt.Tooltip('Share:Q', title='Share', format='.1%'),
+            alt.Tooltip('Squared_Error:Q', title='Squared Error', format='.5f')
+        ]
+    ).properties(
+        height=320
+    ).configure_view(
+        stroke=None
+    )
+
+    return chart
+
 def create_peak_hours_chart(employee_data):
     """
     Create a new enhanced line graph showing peak hours activity
     """
-    # Convert timestamps to datetime
-    employee_data['Login_Timestamp'] = pd.to_datetime(employee_data['Login_Timestamp'])
-    employee_data['Logout_Timestamp'] = pd.to_datetime(employee_data['Logout_Timestamp'])
-
-    # Extract login and logout hours
-    login_hour = employee_data['Login_Timestamp'].dt.hour.iloc[0]
-    logout_hour = employee_data['Logout_Timestamp'].dt.hour.iloc[0]
+    # Login and logout hours are derived once at load time
+    login_hour = int(employee_data['Login_Hour'].iloc[0])
+    logout_hour = int(employee_data['Logout_Hour'].iloc[0])
 
     # Calculate work activity for each hour
     hours_data = pd.DataFrame({
@@ -645,8 +937,7 @@ def main():
     """, unsafe_allow_html=True)
 
     # Load data
-    employee_df = load_data()
-    autoencoder = load_autoencoder_model()
+    employee_store, autoencoder, population_scores, aggregates = load_shared_resources(st.session_state.get('live_follow', False))
 
     # Sidebar with enhanced styling
     st.sidebar.markdown("""
@@ -655,10 +946,22 @@ def main():
         </div>
     """, unsafe_allow_html=True)
     
-    departments = employee_df['Department'].unique()
+    # The SQLite store is reloaded as a whole, so live follow is in-memory only
+    if DATA_BACKEND == 'snapshot' and st.sidebar.checkbox('Live follow', key='live_follow', help='Score sessions appended to the behaviour log as they arrive'):
+        st.sidebar.caption(f"Following {len(employee_store):,} sessions, {int(population_scores.flags.sum()):,} flagged")
+
+    # Fine-tuning runs in the background; the new model is swapped in when it passes validation
+    retrainer = get_retrainer()
+    if st.sidebar.button('Fine-tune Model', disabled=retrainer.running,
+                         help='Warm-start the model on sessions added since it was last trained'):
+        retrainer.start()
+    if retrainer.status != 'idle':
+        reason = (retrainer.report or {}).get('reason')
+        st.sidebar.caption(f"Model fine-tuning: {retrainer.status}" + (f" ({reason})" if reason else ''))
+
+    departments = aggregates.departments()
     selected_department = st.sidebar.selectbox('Select Department', departments)
-    department_employees = employee_df[employee_df['Department'] == selected_department]
-    employee_ids = department_employees['Employee_ID'].unique()
+    employee_ids = aggregates.employee_ids(selected_department)
     selected_id = st.sidebar.selectbox('Select Employee ID', employee_ids)
     
     if st.sidebar.button('Department Analysis'):
@@ -696,15 +999,12 @@ def main():
     
     st.markdown(f"<div class='department-header'><h2>📊 {selected_department} Department Analysis</h2></div>", unsafe_allow_html=True)
     
-    # Filter data for the selected department
-    department_data = employee_df[employee_df['Department'] == selected_department]
-    
-    # Calculate metrics
-    total_employees = len(department_data)
-    anomaly_count = department_data['Access_Anomaly_Flag'].sum()
-    anomaly_rate = (anomaly_count / total_employees) * 100
-    suspicious_count = len(department_data[department_data['Behavior_Label'] == 'Suspicious'])
-    critical_count = len(department_data[department_data['Behavior_Label'] == 'Critical'])
+    # Read precomputed metrics for the selected department
+    department_kpis = aggregates.department_kpis(selected_department)
+    total_employees = department_kpis['Total']
+    anomaly_rate = department_kpis['Anomaly_Rate']
+    suspicious_count = department_kpis['Suspicious']
+    critical_count = department_kpis['Critical']
     
     # Create three columns for KPI cards
     col1, col2, col3 = st.columns(3)
@@ -774,7 +1074,7 @@ def main():
         behavior_data = pd.DataFrame({
             'Behavior': ['Normal', 'Suspicious', 'Critical'],
             'Count': [
-                len(department_data[department_data['Behavior_Label'] == 'Normal']),
+                department_kpis['Normal'],
                 suspicious_count,
                 critical_count
             ]
@@ -820,14 +1120,26 @@ def main():
         </div>
     """, unsafe_allow_html=True)
 
+    # Streaming percentile of the department's errors, kept current as sessions are followed
+    if population_scores.sketches is not None:
+        percentile = population_scores.bundle.percentile if population_scores.bundle is not None else 95
+        department_threshold = population_scores.sketches.threshold(selected_department, percentile)
+        if department_threshold is not None:
+            st.caption(f"{percentile:g}th percentile error in {selected_department}: {department_threshold:.5f} "
+                       f"(anomaly threshold {population_scores.threshold:.5f})")
+
     # Get employee data and validate behavior
-    employee_data = employee_df[employee_df['Employee_ID'] == selected_id].iloc[0]
-    employee_behavior = validate_employee_behavior(selected_id, employee_df, autoencoder)
+    employee_data = employee_store.row(selected_id)
+    employee_behavior = validate_employee_behavior(selected_id, employee_store, population_scores)
+    if DATA_BACKEND == 'snapshot':
+        latest_session = employee_store.sessions(selected_id, last=1)
+    elif DATA_BACKEND == 'sqlite':
+        latest_session = employee_store.employee_rows(selected_id, last=1)
+    else:
+        latest_session = employee_store.latest_session(selected_id)
 
-    # Convert timestamps
-    employee_data['Login_Timestamp'] = pd.to_datetime(employee_data['Login_Timestamp'])
-    employee_data['Logout_Timestamp'] = pd.to_datetime(employee_data['Logout_Timestamp'])
-    session_duration = (employee_data['Logout_Timestamp'] - employee_data['Login_Timestamp']).total_seconds() / 3600
+    # Timestamps are parsed at load time
+    session_duration = employee_data['Session_Minutes'] / 60
 
     # Behavior Alert
     if employee_behavior:
@@ -838,6 +1150,24 @@ def main():
             'Critical': '<div class="status-box critical">🚨 Critical Alert: Confirmed irregular behavior</div>'
         }
         st.markdown(alert_html.get(behavior_label, ''), unsafe_allow_html=True)
+        if employee_behavior['Impossible_Travel']:
+            st.markdown(
+                '<div class="status-box critical">✈️ Impossible Travel: {:,.0f} km from the previous login, {:.1f} hrs earlier</div>'.format(
+                    employee_behavior['Travel_Km'], employee_behavior['Travel_Hours']
+                ),
+                unsafe_allow_html=True
+            )
+        if DATA_BACKEND == 'snapshot':
+            fenced, approved_area = get_geofence_checker(employee_store).status(employee_store.index.latest(selected_id))
+        else:
+            fenced, approved_area = get_geofence_checker().check(latest_session)
+        if fenced and approved_area is None:
+            st.markdown(
+                '<div class="status-box critical">📍 Outside Approved Areas: last login at ({:.3f}, {:.3f}) is not in any area approved for {}</div>'.format(
+                    employee_behavior['Latitude'], employee_behavior['Longitude'], employee_behavior['Department']
+                ),
+                unsafe_allow_html=True
+            )
 
     # KPI Cards
     st.markdown("""
@@ -906,7 +1236,7 @@ def main():
     with col1:
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
         st.markdown('<div class="chart-title">Daily Activity Pattern</div>', unsafe_allow_html=True)
-        peak_hours_chart = create_peak_hours_chart(employee_df[employee_df['Employee_ID'] == selected_id])
+        peak_hours_chart = create_peak_hours_chart(latest_session)
         st.altair_chart(peak_hours_chart, use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
 
@@ -914,12 +1244,82 @@ def main():
         st.markdown('<div class="chart-container">', unsafe_allow_html=True)
         st.markdown('<div class="chart-title">Employee Behaviour Metrics</div>', unsafe_allow_html=True)
         comparison_chart = create_behavior_comparison_chart(
-            employee_df[employee_df['Employee_ID'] == selected_id],
-            department_employees,
+            latest_session,
+            aggregates.department_feature_means(selected_department),
             ['Work_Duration', 'Idle_Time', 'File_Access_Frequency', 'VPN_Usage']
         )
         st.altair_chart(comparison_chart, use_container_width=True)
         st.markdown('</div>', unsafe_allow_html=True)
+
+    # Employees across all departments whose latest session looks most like this one
+    peers = None
+    if DATA_BACKEND == 'snapshot':
+        peers = get_peer_index(employee_store, population_scores).peers(selected_id, PEER_COUNT)
+    if peers is not None and len(peers):
+        peer_rows = [employee_store.row(peer_id) for peer_id in peers['Employee_ID']]
+        peer_scores = [population_scores.lookup(peer_id) for peer_id in peers['Employee_ID']]
+        peers_df = pd.DataFrame({
+            'Employee ID': peers['Employee_ID'],
+            'Department': [row['Department'] for row in peer_rows],
+            'Role': [row['Role'] for row in peer_rows],
+            'Distance': peers['Distance'].round(4),
+            'Reconstruction Error': [round(score['Reconstruction_Error'], 4) for score in peer_scores],
+            'Status': ['Anomalous' if score['Is_Anomaly'] else 'Normal' for score in peer_scores]
+        })
+        st.markdown("<h2 style='color: #191970; margin-top: 2rem;'>👥 Employees Who Behave Like This One</h2>", unsafe_allow_html=True)
+        st.dataframe(peers_df, hide_index=True, use_container_width=True)
+
+    # Which features drive the score, from the per-feature errors kept at scoring time
+    if DATA_BACKEND == 'snapshot':
+        explanation = population_scores.explain(selected_id, k=len(population_scores.features))
+    else:
+        explanation = explain_session(latest_session, autoencoder, population_scores.bundle)
+    contributions = population_scores.contributions
+    department_terms = None if contributions is None else contributions.mean(selected_department)
+    if explanation is not None and department_terms is not None:
+        department_terms = department_terms[explanation['Feature']]
+        department_shares = contributions.mean(selected_department, shares=True)[explanation['Feature']]
+        contribution_df = pd.concat([
+            explanation.assign(Category='Employee'),
+            explanation.assign(Category='Department Average', Squared_Error=department_terms.to_numpy(),
+                               Share=department_shares.to_numpy())
+        ], ignore_index=True)
+        top_features = ', '.join(
+            f"{row.Feature} ({row.Share:.0%})" for row in explanation.head(3).itertuples()
+        )
+        st.markdown("<h2 style='color: #191970; margin-top: 2rem;'>🔍 What Drives This Score</h2>", unsafe_allow_html=True)
+        st.markdown(f'<div class="chart-title">Top contributing features: {top_features}</div>', unsafe_allow_html=True)
+        st.altair_chart(create_feature_contribution_chart(contribution_df), use_container_width=True)
+
+    # Session trend over the employee's recent history, read from the precomputed scores
+    trend_start = employee_data['Login_Timestamp'] - pd.Timedelta(days=TREND_DAYS)
+    # With group models, the rule shows the threshold of the employee's latest session
+    trend_threshold = population_scores.threshold
+    # Streaming keeps no session history, so there is no trend to draw
+    trend_df = None
+    if DATA_BACKEND == 'snapshot':
+        trend_positions = employee_store.index.positions(selected_id, start=trend_start)
+        trend_df = pd.DataFrame({
+            'Login_Timestamp': employee_store.take(trend_positions)['Login_Timestamp'].to_numpy(),
+            'Reconstruction_Error': population_scores.errors[trend_positions],
+            'Is_Anomaly': population_scores.flags[trend_positions]
+        })
+        if population_scores.thresholds is not None and len(trend_positions):
+            trend_threshold = population_scores.thresholds[trend_positions[-1]]
+    elif DATA_BACKEND == 'sqlite':
+        trend_rows = employee_store.employee_rows(selected_id, start=trend_start)
+        trend_df = pd.DataFrame({
+            'Login_Timestamp': trend_rows['Login_Timestamp'].to_numpy(),
+            'Reconstruction_Error': trend_rows['Reconstruction_Error'].to_numpy(),
+            'Is_Anomaly': (trend_rows['Is_Anomaly'] == 1).to_numpy()
+        })
+        if len(trend_rows):
+            trend_threshold = float(trend_rows['Threshold'].iloc[-1])
+    if trend_df is None:
+        st.caption("Session trend unavailable: streaming ingestion keeps no session history")
+    else:
+        st.markdown(f'<div class="chart-title">Session Trend (last {TREND_DAYS} days, {len(trend_df)} sessions)</div>', unsafe_allow_html=True)
+        st.altair_chart(create_session_trend_chart(trend_df, trend_threshold), use_container_width=True)
     
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+import bisect
+import threading
+import numpy as np
+import pandas as pd
+from Behaviour_Data import apply_schema
+
+
+def _login_ns(login_times, rows):
+    """Login times as int64 nanoseconds; all zero (keep row order) when not given."""
+    if login_times is None:
+        return np.zeros(rows, dtype=np.int64)
+    return np.asarray(login_times, dtype='datetime64[ns]').view(np.int64)
+
+
+def _to_ns(timestamp):
+    return pd.Timestamp(timestamp).as_unit('ns').value
+
+
+class EmployeeIndex:
+    """
+    Position map from Employee_ID to the rows it occupies, built with one
+    vectorized sort instead of comparing strings on every lookup.
+
+    Positions are sorted by (Employee_ID, Login_Timestamp) with an offsets
+    array marking where each employee's sessions start, so the latest
+    session is one read and a date range is two binary searches however
+    long the history is. Rows appended later are kept in a small
+    per-employee overflow map. Rows without an Employee_ID are not indexed.
+    """
+
+    def __init__(self, employee_ids, login_times=None):
+        self.reset(employee_ids, login_times)
+
+    def reset(self, employee_ids, login_times=None):
+        """Rebuild the index in place, folding appended rows into the main map."""
+        codes, uniques = pd.factorize(employee_ids)
+        self.code_of = {employee_id: code for code, employee_id in enumerate(uniques)}
+
+        # Row positions grouped by employee, each group in login order;
+        # rows without an Employee_ID (code -1) sort first and are dropped
+        login = _login_ns(login_times, len(codes))
+        self.order = np.lexsort((login, codes))[np.count_nonzero(codes < 0):]
+        self.login = login[self.order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))])
+        # Employee_ID -> [(login ns, position)], kept in login order
+        self.appended = {}
+
+    def __len__(self):
+        return len(self.code_of) + sum(1 for employee_id in self.appended if employee_id not in self.code_of)
+
+    def __contains__(self, employee_id):
+        return employee_id in self.code_of or employee_id in self.appended
+
+    def append(self, employee_ids, start, login_times=None):
+        """Index rows appended at positions start, start + 1, ..."""
+        employee_ids = np.asarray(employee_ids, dtype=object)
+        login = _login_ns(login_times, len(employee_ids)).tolist()
+        for position, (employee_id, login_ns) in enumerate(zip(employee_ids, login), start):
+            if pd.isna(employee_id):
+                continue
+            sessions = self.appended.setdefault(employee_id, [])
+            if sessions and login_ns < sessions[-1][0]:
+                bisect.insort(sessions, (login_ns, position))
+            else:
+                sessions.append((login_ns, position))
+
+    def _sessions(self, employee_id):
+        """Return an employee's (positions, login times), in login order."""
+        code = self.code_of.get(employee_id)
+        if code is None:
+            positions, login = self.order[:0], self.login[:0]
+        else:
+            block = slice(self.offsets[code], self.offsets[code + 1])
+            positions, login = self.order[block], self.login[block]
+
+        extra = self.appended.get(employee_id)
+        if extra is None:
+            return positions, login
+        extra_login, extra_positions = (np.asarray(values, dtype=np.int64) for values in zip(*extra))
+        login = np.concatenate([login, extra_login])
+        positions = np.concatenate([positions, extra_positions.astype(positions.dtype)])
+        if len(login) > len(extra) and login[len(login) - len(extra) - 1] > extra_login[0]:
+            merged = np.argsort(login, kind='stable')
+            positions, login = positions[merged], login[merged]
+        return positions, login
+
+    def positions(self, employee_id, start=None, end=None):
+        """
+        Return the row positions of an employee's sessions in login order
+        (empty if unknown), optionally only those logged in within
+        [start, end).
+        """
+        positions, login = self._sessions(employee_id)
+        lo = 0 if start is None else np.searchsorted(login, _to_ns(start), side='left')
+        hi = len(login) if end is None else np.searchsorted(login, _to_ns(end), side='left')
+        return positions[lo:hi]
+
+    def first(self, employee_id):
+        """Return the position of the employee's earliest session, or None if unknown."""
+        positions, _ = self._sessions(employee_id)
+        return int(positions[0]) if len(positions) else None
+
+    def latest(self, employee_id):
+        """Return the position of the employee's latest session, or None if unknown."""
+        code = self.code_of.get(employee_id)
+        if code is not None and employee_id not in self.appended:
+            return int(self.order[self.offsets[code + 1] - 1])
+        positions, _ = self._sessions(employee_id)
+        return int(positions[-1]) if len(positions) else None
+
+    def latest_positions(self):
+        """Return every Employee_ID and the position of their latest session, with one gather."""
+        employee_ids = list(self.code_of)
+        positions = self.order[self.offsets[1:] - 1]
+        extra_ids, extra_positions = [], []
+        for employee_id in self.appended:
+            code = self.code_of.get(employee_id)
+            if code is None:
+                extra_ids.append(employee_id)
+                extra_positions.append(self.latest(employee_id))
+            else:
+                positions[code] = self.latest(employee_id)
+        return employee_ids + extra_ids, np.concatenate([positions, np.asarray(extra_positions, dtype=positions.dtype)])
+
+
+class EmployeeStore:
+    """
+    The behaviour frame together with its Employee_ID index. An employee
+    can have any number of sessions; they are returned in login order.
+
+    Appended rows are kept as separate tail frames and only concatenated
+    into the main frame once they reach `compact_ratio` of its size, so
+    appends cost time proportional to the new rows.
+    """
+
+    def __init__(self, employee_df, compact_ratio=0.1):
+        self._base = employee_df
+        self._tail = []
+        self._tail_bounds = []
+        self._size = len(employee_df)
+        self._lock = threading.RLock()
+        self.compact_ratio = compact_ratio
+        self.index = EmployeeIndex(employee_df['Employee_ID'], employee_df['Login_Timestamp'])
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, employee_id):
+        return employee_id in self.index
+
+    @property
+    def frame(self):
+        """The full frame, folding any appended rows into it first."""
+        with self._lock:
+            if self._tail:
+                self._compact()
+            return self._base
+
+    def _compact(self):
+        attrs = self._base.attrs
+        self._base = apply_schema(pd.concat([self._base] + self._tail, ignore_index=True))
+        self._base.attrs = attrs
+        self._tail = []
+        self._tail_bounds = []
+        self.index.reset(self._base['Employee_ID'], self._base['Login_Timestamp'])
+
+    def append(self, new_rows):
+        """Add rows to the end of the store and index them."""
+        if new_rows.empty:
+            return
+        with self._lock:
+            start = self._size
+            self._tail.append(new_rows.reset_index(drop=True))
+            self._tail_bounds.append(start)
+            self._size += len(new_rows)
+            self.index.append(new_rows['Employee_ID'], start, new_rows['Login_Timestamp'])
+            if self._size - len(self._base) > self.compact_ratio * len(self._base):
+                self._compact()
+
+    def take(self, positions):
+        """Return the rows at the given positions, in that order."""
+        base_rows = len(self._base)
+        if not self._tail or (len(positions) and positions.max() < base_rows):
+            return self._base.iloc[positions]
+
+        in_base = positions < base_rows
+        parts = [self._base.iloc[positions[in_base]]]
+        for position in positions[~in_base]:
+            segment = bisect.bisect_right(self._tail_bounds, position) - 1
+            parts.append(self._tail[segment].iloc[[position - self._tail_bounds[segment]]])
+        # Put the rows back in the order they were asked for
+        requested = np.argsort(np.concatenate([np.flatnonzero(in_base), np.flatnonzero(~in_base)]), kind='stable')
+        return pd.concat(parts).iloc[requested]
+
+    def row(self, employee_id):
+        """Return the employee's latest session as a Series, or None if unknown."""
+        with self._lock:
+            position = self.index.latest(employee_id)
+            if position is None:
+                return None
+            return self.take(np.array([position])).iloc[0]
+
+    def sessions(self, employee_id, start=None, end=None, last=None):
+        """
+        Return the employee's sessions in login order as a DataFrame,
+        optionally only those logged in within [start, end) and only the
+        `last` most recent of those.
+        """
+        with self._lock:
+            positions = self.index.positions(employee_id, start, end)
+            if last is not None:
+                positions = positions[-last:]
+            return self.take(positions)
+
+    def rows(self, employee_id):
+        """Return all of the employee's sessions as a DataFrame, in login order."""
+        return self.sessions(employee_id)
@@ -0,0 +1,366 @@
+import json
+import time
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from Behaviour_Data import DATA_PATH, load_behaviour_data
+from Travel_Detector import EARTH_RADIUS_KM, haversine_km
+
+GEOFENCE_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\approved_areas.json"
+
+GEOFENCE_VERSION = 1
+
+# Areas listed under this department apply to every department
+ALL_DEPARTMENTS = '*'
+
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+
+
+def _expand(starts, counts):
+    """For CSR ranges [start, start + count), return each element's range number and flat position."""
+    owners = np.repeat(np.arange(len(counts)), counts)
+    return owners, np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+
+
+def _circle_bounds(lat, lon, radius_km):
+    dlat = radius_km / KM_PER_DEGREE
+    cos_lat = np.cos(np.radians(min(abs(lat) + dlat, 90.0)))
+    dlon = 180.0 if cos_lat < 1e-9 else min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+    return lat - dlat, lat + dlat, lon - dlon, lon + dlon
+
+
+class GeofenceIndex:
+    """
+    Approved areas per Department, circles and polygons in degrees, with a
+    uniform lat/lon grid over their bounding boxes. classify() checks
+    millions of sessions in bulk: each point is matched only against the
+    areas registered in its grid cell, and the exact circle (haversine) and
+    polygon (ray casting) tests run vectorized over all candidate pairs.
+
+    Polygons are [lat, lon] vertex lists and must not cross the
+    antimeridian.
+    """
+
+    def __init__(self, areas, cell_deg=0.5):
+        self.areas = list(areas)
+        self.cell_deg = cell_deg
+        self.n_rows = int(np.ceil(180 / cell_deg))
+        self.n_cols = int(np.ceil(360 / cell_deg))
+
+        self.departments = sorted({area['Department'] for area in self.areas} - {ALL_DEPARTMENTS})
+        code_of = {department: code for code, department in enumerate(self.departments)}
+        self.area_department = np.array(
+            [code_of.get(area['Department'], -1) for area in self.areas], dtype=np.int32
+        )
+        self.is_circle = np.array([area['type'] == 'circle' for area in self.areas], dtype=bool)
+
+        circles = [area for area in self.areas if area['type'] == 'circle']
+        self.circle_lat = np.zeros(len(self.areas))
+        self.circle_lon = np.zeros(len(self.areas))
+        self.circle_radius = np.zeros(len(self.areas))
+        self.circle_lat[self.is_circle] = [area['center'][0] for area in circles]
+        self.circle_lon[self.is_circle] = [area['center'][1] for area in circles]
+        self.circle_radius[self.is_circle] = [area['radius_km'] for area in circles]
+
+        # Polygon edges, flattened with per-area offsets (circles have none)
+        edges, counts = [], []
+        for area in self.areas:
+            if area['type'] == 'circle':
+                counts.append(0)
+                continue
+            points = np.asarray(area['points'], dtype=np.float64)
+            edges.append(np.hstack([points, np.roll(points, -1, axis=0)]))
+            counts.append(len(points))
+        self.edge_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.edges = np.vstack(edges) if edges else np.empty((0, 4))
+
+        self._build_grid()
+
+    def _bounds(self, area):
+        if area['type'] == 'circle':
+            return _circle_bounds(area['center'][0], area['center'][1], area['radius_km'])
+        points = np.asarray(area['points'], dtype=np.float64)
+        return points[:, 0].min(), points[:, 0].max(), points[:, 1].min(), points[:, 1].max()
+
+    def _row(self, lat):
+        return np.clip(np.floor((np.asarray(lat) + 90) / self.cell_deg).astype(np.int64), 0, self.n_rows - 1)
+
+    def _col(self, lon):
+        return np.clip(np.floor((np.asarray(lon) + 180) / self.cell_deg).astype(np.int64), 0, self.n_cols - 1)
+
+    def _cols(self, lon_min, lon_max):
+        """Columns covering a longitude range, wrapped around the antimeridian."""
+        if lon_max - lon_min >= 360:
+            return np.arange(self.n_cols)
+        ranges = [(max(lon_min, -180.0), min(lon_max, 180.0))]
+        if lon_min < -180:
+            ranges.append((lon_min + 360, 180.0))
+        if lon_max > 180:
+            ranges.append((-180.0, lon_max - 360))
+        return np.unique(np.concatenate([np.arange(first, last + 1) for first, last in map(self._col, ranges)]))
+
+    def _cells(self, lat, lon):
+        return self._row(lat) * self.n_cols + self._col(lon)
+
+    def _build_grid(self):
+        cells, owners = [], []
+        for i, area in enumerate(self.areas):
+            lat_min, lat_max, lon_min, lon_max = self._bounds(area)
+            row_min, row_max = self._row([lat_min, lat_max])
+            rows, cols = np.meshgrid(np.arange(row_min, row_max + 1), self._cols(lon_min, lon_max), indexing='ij')
+            cells.append((rows * self.n_cols + cols).ravel())
+            owners.append(np.full(cells[-1].size, i, dtype=np.int32))
+        cells = np.concatenate(cells) if cells else np.empty(0, dtype=np.int64)
+        owners = np.concatenate(owners) if owners else np.empty(0, dtype=np.int32)
+        order = np.argsort(cells, kind='stable')
+        self.cell_areas = owners[order]
+        self.cell_offsets = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self.n_rows * self.n_cols))])
+
+    def department_codes(self, departments):
+        """Map department names to area codes; departments without own areas get -2."""
+        codes, uniques = pd.factorize(np.asarray(departments, dtype=object))
+        lookup = {department: code for code, department in enumerate(self.departments)}
+        mapped = np.array([lookup.get(department, -2) for department in uniques], dtype=np.int32)
+        return mapped[codes] if len(codes) else np.empty(0, dtype=np.int32)
+
+    def fenced(self, departments):
+        """True for points whose department has approved areas of its own or shared ones."""
+        if (self.area_department == -1).any():
+            return np.ones(len(departments), dtype=bool)
+        return self.department_codes(departments) >= 0
+
+    def classify(self, latitude, longitude, departments, chunk_points=262_144):
+        """
+        Return, for every point, the index of the first approved area of its
+        department that contains it, or -1.
+        """
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        department = self.department_codes(departments)
+        result = np.full(len(latitude), -1, dtype=np.int64)
+        for start in range(0, len(latitude), chunk_points):
+            chunk = slice(start, start + chunk_points)
+            result[chunk] = self._classify_chunk(latitude[chunk], longitude[chunk], department[chunk])
+        return result
+
+    def _classify_chunk(self, lat, lon, department):
+        result = np.full(len(lat), len(self.areas), dtype=np.int64)
+
+        # Every (point, area) pair that shares a grid cell, as flat arrays
+        cells = self._cells(lat, lon)
+        starts = self.cell_offsets[cells]
+        counts = self.cell_offsets[cells + 1] - starts
+        points, flat = _expand(starts, counts)
+        areas = self.cell_areas[flat]
+
+        owner = self.area_department[areas]
+        keep = (owner == -1) | (owner == department[points])
+        points, areas = points[keep], areas[keep]
+
+        circle = self.is_circle[areas]
+        p, a = points[circle], areas[circle]
+        inside = haversine_km(lat[p], lon[p], self.circle_lat[a], self.circle_lon[a]) <= self.circle_radius[a]
+        np.minimum.at(result, p[inside], a[inside])
+
+        p, a = points[~circle], areas[~circle]
+        inside = self._in_polygons(lat[p], lon[p], a)
+        np.minimum.at(result, p[inside], a[inside])
+
+        result[result == len(self.areas)] = -1
+        return result
+
+    def _in_polygons(self, lat, lon, areas):
+        """Even-odd ray casting of (point, polygon) pairs against every edge of their polygon at once."""
+        starts = self.edge_offsets[areas]
+        counts = self.edge_offsets[areas + 1] - starts
+        pairs, flat = _expand(starts, counts)
+        edge = self.edges[flat]
+        y, x = lat[pairs], lon[pairs]
+        y1, x1, y2, x2 = edge.T
+        spans = (y1 > y) != (y2 > y)
+        cross_x = np.divide((x2 - x1) * (y - y1), y2 - y1, out=np.zeros_like(y), where=spans) + x1
+        crossings = np.bincount(pairs, weights=spans & (x < cross_x), minlength=len(areas))
+        return crossings.astype(np.int64) % 2 == 1
+
+    def classify_naive(self, latitude, longitude, departments):
+        """Reference check of every point against every area, for benchmarks and tests."""
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        department = self.department_codes(departments)
+        result = np.full(len(latitude), -1, dtype=np.int64)
+        for i in range(len(self.areas) - 1, -1, -1):
+            owner = self.area_department[i]
+            candidates = np.flatnonzero((owner == -1) | (department == owner))
+            if self.is_circle[i]:
+                inside = haversine_km(latitude[candidates], longitude[candidates],
+                                      self.circle_lat[i], self.circle_lon[i]) <= self.circle_radius[i]
+            else:
+                inside = self._in_polygons(latitude[candidates], longitude[candidates],
+                                           np.full(len(candidates), i, dtype=np.int64))
+            result[candidates[inside]] = i
+        return result
+
+
+def load_geofences(path=GEOFENCE_PATH, cell_deg=0.5):
+    """
+    Read approved areas from a JSON file and index them; None if the file
+    does not exist. Each area has a Department ('*' for all), a name and
+    either type 'circle' with center [lat, lon] and radius_km, or type
+    'polygon' with points [[lat, lon], ...].
+    """
+    try:
+        with open(path) as f:
+            payload = json.load(f)
+    except FileNotFoundError:
+        return None
+    if payload.get('version') != GEOFENCE_VERSION:
+        raise ValueError(f"Unsupported geofence file version in {path}")
+    for area in payload['areas']:
+        if area.get('type') not in ('circle', 'polygon'):
+            raise ValueError(f"Area {area.get('name')!r} has unknown type {area.get('type')!r}")
+    return GeofenceIndex(payload['areas'], cell_deg)
+
+
+class GeofenceChecker:
+    """
+    Approved-area classification of every session in an EmployeeStore.
+    sync() classifies a new store in bulk and only the appended rows of a
+    store it has already seen. Without a geofence file nothing is checked.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.store = None
+        self.rows = 0
+        self.area = np.empty(0, dtype=np.int64)
+        self.checked = np.empty(0, dtype=bool)
+        self._lock = threading.Lock()
+
+    def _classify(self, rows):
+        return (
+            self.index.classify(rows['Latitude'], rows['Longitude'], rows['Department']),
+            self.index.fenced(rows['Department'])
+        )
+
+    def sync(self, employee_store):
+        with self._lock:
+            if self.index is None:
+                return
+            if employee_store is not self.store:
+                self.store, self.rows = employee_store, len(employee_store)
+                self.area, self.checked = self._classify(employee_store.frame)
+            elif len(employee_store) > self.rows:
+                area, checked = self._classify(employee_store.take(np.arange(self.rows, len(employee_store))))
+                self.area = np.concatenate([self.area, area])
+                self.checked = np.concatenate([self.checked, checked])
+                self.rows = len(employee_store)
+
+    def status(self, position):
+        """
+        Return (checked, area name) for one session: whether its department
+        has approved areas, and the area it falls in (None if outside).
+        """
+        if self.index is None or position is None or position >= len(self.area):
+            return False, None
+        return bool(self.checked[position]), self._area_name(self.area[position])
+
+    def check(self, sessions):
+        """
+        Like status(), for the last of `sessions` (a frame), classified on
+        the spot; for sessions read from somewhere other than a synced store.
+        """
+        if self.index is None or not len(sessions):
+            return False, None
+        area, checked = self._classify(sessions.tail(1))
+        return bool(checked[0]), self._area_name(area[0])
+
+    def _area_name(self, area):
+        return None if area < 0 else self.index.areas[area].get('name', f'area {area}')
+
+    def outside(self):
+        """Mask of sessions that were checked and fall outside every approved area."""
+        return self.checked & (self.area < 0)
+
+
+def _synthetic_areas(count, departments, seed=0):
+    """
+    Random circles and polygons (irregular n-gons of 10 to 150 km) for
+    benchmarks. Circles may cross the antimeridian and the first area always
+    does, so the comparison with classify_naive covers the wrap-around.
+    """
+    rng = np.random.default_rng(seed)
+    areas = [{'Department': ALL_DEPARTMENTS, 'name': 'antimeridian', 'type': 'circle',
+              'center': [-17.0, 179.9], 'radius_km': 100.0}]
+    for i in range(1, count):
+        lat, lon = rng.uniform(-70, 70), rng.uniform(-180, 180)
+        radius_km = rng.uniform(10, 150)
+        department = departments[i % len(departments)]
+        if i % 2:
+            areas.append({'Department': department, 'name': f'circle {i}', 'type': 'circle',
+                          'center': [lat, lon], 'radius_km': radius_km})
+            continue
+        # Polygons must not cross the antimeridian
+        lon = np.clip(lon, -170, 170)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, rng.integers(5, 13)))
+        reach = radius_km * rng.uniform(0.5, 1.0, len(angles)) / KM_PER_DEGREE
+        areas.append({'Department': department, 'name': f'polygon {i}', 'type': 'polygon',
+                      'points': np.column_stack([lat + reach * np.sin(angles),
+                                                 lon + reach * np.cos(angles) / np.cos(np.radians(lat))]).tolist()})
+    return areas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify sessions against approved areas and measure points/sec.")
+    parser.add_argument('csv_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--geofences', default=GEOFENCE_PATH)
+    parser.add_argument('--synthetic-areas', type=int, help="Benchmark against this many random areas instead of the file")
+    parser.add_argument('--points', type=int, default=None, help="Random points to classify instead of the CSV sessions")
+    parser.add_argument('--cell-deg', type=float, default=0.5)
+    parser.add_argument('--naive-sample', type=int, default=20_000, help="Points to check against every area for comparison")
+    args = parser.parse_args()
+
+    employee_df = load_behaviour_data(args.csv_path)
+    departments = sorted(employee_df['Department'].astype(str).unique())
+    if args.points:
+        rng = np.random.default_rng(1)
+        latitude, longitude = rng.uniform(-90, 90, args.points), rng.uniform(-180, 180, args.points)
+        point_departments = np.asarray(departments, dtype=object)[rng.integers(0, len(departments), args.points)]
+    else:
+        latitude, longitude = employee_df['Latitude'].to_numpy(), employee_df['Longitude'].to_numpy()
+        point_departments = employee_df['Department'].astype(str).to_numpy()
+
+    start = time.perf_counter()
+    if args.synthetic_areas:
+        index = GeofenceIndex(_synthetic_areas(args.synthetic_areas, departments), args.cell_deg)
+    else:
+        index = load_geofences(args.geofences, args.cell_deg)
+        if index is None:
+            parser.error(f"No geofence file at {args.geofences}; pass --synthetic-areas to benchmark")
+    built = time.perf_counter()
+    area = index.classify(latitude, longitude, point_departments)
+    elapsed = time.perf_counter() - built
+    print(f"{len(index.areas):,} areas indexed in {built - start:.2f} s ({index.cell_deg} deg cells)")
+    print(f"{len(latitude):,} points in {elapsed:.2f} s: {len(latitude) / elapsed:,.0f} points/s, "
+          f"{int((area >= 0).sum()):,} inside an approved area")
+
+    sample = slice(0, min(args.naive_sample, len(latitude)))
+    start = time.perf_counter()
+    naive = index.classify_naive(latitude[sample], longitude[sample], point_departments[sample])
+    naive_elapsed = time.perf_counter() - start
+    print(f"Naive check of every area: {len(naive) / naive_elapsed:,.0f} points/s on {len(naive):,} points, "
+          f"results {'match' if np.array_equal(naive, area[sample]) else 'DIFFER'}")
+
+    if args.synthetic_areas:
+        # Points around the first synthetic circle, whose cells wrap from one edge of the grid to the other
+        rng = np.random.default_rng(2)
+        probe_lat = rng.uniform(-19, -15, 5_000)
+        probe_lon = (rng.uniform(178, 182, 5_000) + 180) % 360 - 180
+        probe_departments = np.asarray(departments, dtype=object)[rng.integers(0, len(departments), 5_000)]
+        same = np.array_equal(index.classify(probe_lat, probe_lon, probe_departments),
+                              index.classify_naive(probe_lat, probe_lon, probe_departments))
+        print(f"Antimeridian check on {len(probe_lat):,} points: results {'match' if same else 'DIFFER'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import argparse
+import subprocess
+
+PAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Importing a page file only defines its functions; main() is never called
+_LOAD_PAGE = (
+    "import importlib.util, sys; sys.path.insert(0, {page_dir!r}); "
+    "spec = importlib.util.spec_from_file_location('profiled_page', {path!r}); "
+    "module = importlib.util.module_from_spec(spec); spec.loader.exec_module(module)"
+)
+
+
+def _run_importtime(code):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Import failed:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, raw_name = line[len('import time:'):].split('|')
+        depth = (len(raw_name) - len(raw_name.lstrip()) - 1) // 2
+        entries.append((raw_name.strip(), depth, int(self_us), int(cumulative_us)))
+    return entries
+
+
+def profile_imports(target):
+    """
+    Measure what importing a page file or module costs, beyond the modules
+    the interpreter loads at startup. Returns a list of
+    (top_level_module, cumulative_ms) sorted by cost, and the set of every
+    module name that was imported.
+    """
+    if target.endswith('.py'):
+        path = target if os.path.isabs(target) else os.path.join(PAGE_DIR, target)
+        code = _LOAD_PAGE.format(page_dir=PAGE_DIR, path=path)
+    else:
+        code = f"import sys; sys.path.insert(0, {PAGE_DIR!r}); import {target}"
+
+    startup = {name for name, _, _, _ in _run_importtime('pass')}
+    entries = _run_importtime(code)
+
+    top_level = [
+        (name, cumulative_us / 1000.0)
+        for name, depth, _, cumulative_us in entries
+        if depth == 0 and name not in startup
+    ]
+    top_level.sort(key=lambda item: item[1], reverse=True)
+    imported = {name for name, _, _, _ in entries if name not in startup}
+    return top_level, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report per-module cumulative import time of a page or module.")
+    parser.add_argument('target', nargs='?', default='Employee App.py', help="page file (.py) or module name")
+    parser.add_argument('--top', type=int, default=15, help="number of modules to list")
+    parser.add_argument('--budget-ms', type=float, default=None, help="fail if the total import time exceeds this")
+    parser.add_argument('--forbid', action='append', default=[], help="fail if this module is imported (repeatable)")
+    args = parser.parse_args()
+
+    top_level, imported = profile_imports(args.target)
+    total_ms = sum(ms for _, ms in top_level)
+
+    print(f"Import profile for {args.target}")
+    print(f"{'cumulative ms':>14}  module")
+    for name, ms in top_level[:args.top]:
+        print(f"{ms:>14.1f}  {name}")
+    print(f"{total_ms:>14.1f}  total ({len(imported)} modules)")
+
+    failures = []
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        failures.append(f"total import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.1f} ms")
+    for name in args.forbid:
+        if name in imported:
+            failures.append(f"'{name}' is imported eagerly")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
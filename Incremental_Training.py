@@ -0,0 +1,197 @@
+import os
+import time
+import argparse
+import threading
+import numpy as np
+from Behaviour_Data import DATA_PATH, load_behaviour_data, data_fingerprint, file_fingerprint
+from Scoring_Engine import reconstruction_errors
+from Model_Bundle import MODEL_PATH, load_model_bundle, calibrate_threshold
+from Numpy_Autoencoder import npz_path, export_autoencoder, load_numpy_autoencoder, verify_export, load_scoring_model
+from Train_Autoencoder import tf, split_rows, fit_autoencoder
+
+# Fine-tuning steps are smaller than training from scratch
+FINE_TUNE_LEARNING_RATE = 1e-4
+
+
+def _mean_loss(X, autoencoder):
+    return float(np.mean(reconstruction_errors(X, autoencoder, 65536)))
+
+
+def fine_tune(csv_path=DATA_PATH, model_path=MODEL_PATH, epochs=5, batch_size=1024, patience=2,
+              holdout_fraction=0.2, validation_fraction=0.1, reference_rows=50_000, min_new_rows=1000,
+              max_reference_regression=0.05, learning_rate=FINE_TUNE_LEARNING_RATE, seed=42, install=None,
+              verbose=0):
+    """
+    Warm-start the current model on the sessions appended since its last
+    training checkpoint (bundle.trained_rows) and keep it only if it passes
+    validation.
+
+    The new sessions are split three ways: training, an early-stopping
+    validation part and an acceptance holdout the fit never sees. The
+    candidate must not do worse than the current model on that holdout,
+    nor more than `max_reference_regression` (relative) worse on a sample of
+    older sessions, so drift is followed without forgetting; with no older
+    sessions there is nothing to forget and that check is skipped. The
+    scaler is kept as-is so model inputs stay in the same space.
+
+    An accepted model is written next to a temporary name first; `install`
+    (default: write the files directly) receives a callable that moves the
+    NumPy weights, model and bundle into place, so a caller can run it
+    while readers of those files are held off. Returns a report dict.
+    """
+    started = time.perf_counter()
+    tf.keras.utils.set_random_seed(seed)
+
+    bundle = load_model_bundle(model_path)
+    if bundle is None or not bundle.matches_model(model_path):
+        raise ValueError(f"No model bundle matching {model_path}; train a model first")
+    checkpoint = bundle.trained_rows if bundle.trained_rows is not None else bundle.rows
+
+    employee_df = load_behaviour_data(csv_path)
+    report = {'checkpoint': checkpoint, 'rows': len(employee_df), 'new_rows': max(len(employee_df) - checkpoint, 0)}
+    if report['new_rows'] < min_new_rows:
+        return dict(report, status='skipped', reason=f"{report['new_rows']} new rows, need {min_new_rows}")
+
+    X_scaled = bundle.transform_frame(employee_df).astype(np.float32)
+    new_fit, new_holdout = split_rows(len(employee_df) - checkpoint, holdout_fraction, seed)
+    fit_train, fit_validation = split_rows(len(new_fit), validation_fraction, seed + 1)
+    X_train, X_validation = X_scaled[checkpoint + new_fit[fit_train]], X_scaled[checkpoint + new_fit[fit_validation]]
+    X_holdout = X_scaled[checkpoint + new_holdout]
+    reference = np.random.default_rng(seed).choice(checkpoint, min(reference_rows, checkpoint), replace=False)
+    X_reference = X_scaled[np.sort(reference)]
+
+    def losses(autoencoder):
+        return {
+            'holdout_loss': _mean_loss(X_holdout, autoencoder),
+            'reference_loss': _mean_loss(X_reference, autoencoder) if len(X_reference) else None
+        }
+
+    autoencoder = tf.keras.models.load_model(model_path)
+    before = losses(autoencoder)
+
+    autoencoder.compile(optimizer=tf.keras.optimizers.RMSprop(learning_rate), loss='mean_squared_error')
+    _, epoch_seconds = fit_autoencoder(autoencoder, X_train, X_validation, epochs, batch_size, patience, seed, verbose)
+    after = losses(autoencoder)
+
+    report.update({
+        'train_rows': len(X_train),
+        'validation_rows': len(X_validation),
+        'holdout_rows': len(X_holdout),
+        'reference_rows': len(X_reference),
+        'epochs_run': len(epoch_seconds),
+        'samples_per_sec': len(X_train) * len(epoch_seconds) / sum(epoch_seconds),
+        'before': before,
+        'after': after
+    })
+    if after['holdout_loss'] > before['holdout_loss']:
+        return dict(report, status='rejected', reason='no improvement on the new-session holdout',
+                    wall_seconds=time.perf_counter() - started)
+    if not len(X_reference):
+        report['reference_check'] = 'skipped: no sessions before the checkpoint'
+    elif after['reference_loss'] > before['reference_loss'] * (1 + max_reference_regression):
+        return dict(report, status='rejected', reason='regressed on older sessions',
+                    wall_seconds=time.perf_counter() - started)
+
+    # Build every artifact under temporary names, then move them into place together
+    root, extension = os.path.splitext(model_path)
+    tmp_model = f'{root}.tmp-{os.getpid()}{extension}'
+    tmp_npz = f'{root}.tmp-{os.getpid()}.npz'
+    autoencoder.save(tmp_model)
+    export_autoencoder(tmp_model, tmp_npz)
+    numpy_autoencoder = load_numpy_autoencoder(tmp_npz)
+    verify_export(autoencoder, numpy_autoencoder, len(bundle.features))
+
+    bundle.model_fingerprint = file_fingerprint(tmp_model)
+    bundle.trained_rows = len(employee_df)
+    errors = reconstruction_errors(X_scaled, numpy_autoencoder, 65536)
+
+    def move_into_place():
+        os.replace(tmp_npz, npz_path(model_path))
+        os.replace(tmp_model, model_path)
+        calibrate_threshold(bundle, employee_df, errors, data_fingerprint(csv_path), model_path)
+
+    try:
+        (install or (lambda move: move()))(move_into_place)
+    finally:
+        for path in (tmp_npz, tmp_model):
+            if os.path.exists(path):
+                os.remove(path)
+    return dict(report, status='accepted', threshold=bundle.threshold, wall_seconds=time.perf_counter() - started)
+
+
+class BackgroundRetrainer:
+    """
+    Runs fine_tune() on a background thread so the dashboard keeps serving.
+    An accepted model is swapped into the ResourceManager while the model
+    and population score resources are held, so no session ever loads a
+    model file with a mismatched bundle; population scores are rebuilt
+    with the new model on their next access.
+    """
+
+    def __init__(self, manager, csv_path=DATA_PATH, model_path=MODEL_PATH, backend='numpy', **options):
+        self.manager = manager
+        self.csv_path = csv_path
+        self.model_path = model_path
+        self.backend = backend
+        self.options = options
+        self.status = 'idle'
+        self.report = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Start a fine-tuning run unless one is already in progress; return whether it started."""
+        with self._lock:
+            if self.running:
+                return False
+            self.status = 'running'
+            self._thread = threading.Thread(target=self._run, name='background-retrainer', daemon=True)
+            self._thread.start()
+            return True
+
+    def _install(self, move_into_place):
+        with self.manager.hold('population_scores', 'autoencoder'):
+            move_into_place()
+            self.manager.swap('autoencoder', load_scoring_model(self.model_path, self.backend))
+
+    def _run(self):
+        try:
+            self.report = fine_tune(self.csv_path, self.model_path, install=self._install, **self.options)
+            self.status = self.report['status']
+        except Exception as error:
+            self.report = {'status': 'failed', 'reason': repr(error)}
+            self.status = 'failed'
+
+    def close(self):
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune the autoencoder on sessions added since its last training.")
+    parser.add_argument('csv_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--epochs', type=int, default=5)
+    parser.add_argument('--min-new-rows', type=int, default=1000)
+    parser.add_argument('--max-reference-regression', type=float, default=0.05)
+    args = parser.parse_args()
+
+    report = fine_tune(args.csv_path, args.model, epochs=args.epochs, min_new_rows=args.min_new_rows,
+                       max_reference_regression=args.max_reference_regression, verbose=2)
+    print(f"{report['status'].title()}: {report.get('reason', '')}".rstrip(': '))
+    print(f"Checkpoint {report['checkpoint']:,} rows, {report['new_rows']:,} new")
+    if 'before' in report:
+        for split in ('holdout_loss', 'reference_loss'):
+            if report['before'][split] is not None:
+                print(f"  {split}: {report['before'][split]:.6f} -> {report['after'][split]:.6f}")
+        if 'reference_check' in report:
+            print(f"  reference check {report['reference_check']}")
+        print(f"  {report['samples_per_sec']:,.0f} samples/s, wall time {report['wall_seconds']:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import sys
+import time
+import importlib
+import threading
+
+# Every lazy module handed out, by name, so load times can be reported
+_registry = {}
+_lock = threading.Lock()
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access.
+    Once loaded, attribute lookups go straight to the real module.
+    """
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_load_seconds'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            with _lock:
+                module = self.__dict__['_module']
+                if module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._name)
+                    self.__dict__['_load_seconds'] = time.perf_counter() - start
+                    self.__dict__['_module'] = module
+        return module
+
+    @property
+    def is_loaded(self):
+        return self.__dict__['_module'] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+def lazy_import(name):
+    """
+    Return a module that is imported the first time one of its attributes
+    is used. Modules that are already imported are returned as-is.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    with _lock:
+        if name not in _registry:
+            _registry[name] = LazyModule(name)
+        return _registry[name]
+
+
+def lazy_import_report():
+    """Return (name, loaded, seconds) for every lazy module handed out."""
+    return [
+        (name, module.is_loaded, module.__dict__['_load_seconds'])
+        for name, module in sorted(_registry.items())
+    ]
@@ -0,0 +1,157 @@
+import os
+import json
+import numpy as np
+from Behaviour_Data import file_fingerprint
+from Scoring_Engine import FEATURES, reconstruction_errors, reference_window_mask, population_threshold
+
+MODEL_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\autoencoder_model.keras"
+
+BUNDLE_VERSION = 1
+
+
+def bundle_path(model_path):
+    """Return the bundle file that sits next to the model file."""
+    root, _ = os.path.splitext(model_path)
+    return root + '.bundle.json'
+
+
+class ModelBundle:
+    """
+    Calibration artifacts that belong to one autoencoder model: the fitted
+    min-max scaling parameters, the feature order and the anomaly threshold.
+
+    The scaler is pinned to the model version. The threshold is calibrated
+    over the population's errors and tagged with the fingerprint of the data
+    it was calibrated on, optionally restricted to the last `reference_days`.
+    `trained_rows` is how many rows of the (append-only) behaviour log the
+    model has been trained on, the checkpoint for incremental training.
+    """
+
+    def __init__(self, features, data_min, data_max, threshold, percentile=95,
+                 feature_range=(0.0, 1.0), model_fingerprint=None, data_fingerprint=None, rows=0,
+                 reference_days=None, trained_rows=None):
+        self.features = list(features)
+        self.data_min = np.asarray(data_min, dtype=np.float64)
+        self.data_max = np.asarray(data_max, dtype=np.float64)
+        self.feature_range = tuple(feature_range)
+        self.threshold = float(threshold)
+        self.percentile = percentile
+        self.model_fingerprint = model_fingerprint
+        self.data_fingerprint = data_fingerprint
+        self.rows = rows
+        self.reference_days = reference_days
+        self.trained_rows = trained_rows
+
+        # Same arithmetic as MinMaxScaler, constant features map to range min
+        data_range = self.data_max - self.data_min
+        data_range[data_range == 0.0] = 1.0
+        self.scale_ = (self.feature_range[1] - self.feature_range[0]) / data_range
+        self.min_ = self.feature_range[0] - self.data_min * self.scale_
+
+    def transform(self, X):
+        """Scale a feature matrix with the stored parameters."""
+        return np.asarray(X, dtype=np.float64) * self.scale_ + self.min_
+
+    def transform_frame(self, employee_df):
+        """Select the bundle's features from a frame, in order, and scale them."""
+        return self.transform(employee_df[self.features].to_numpy(dtype=np.float64))
+
+    def matches_model(self, model_path):
+        return self.model_fingerprint == file_fingerprint(model_path)
+
+    def is_calibrated_for(self, data_fingerprint):
+        return self.data_fingerprint == data_fingerprint
+
+    def to_dict(self):
+        return {
+            'version': BUNDLE_VERSION,
+            'features': self.features,
+            'scaler': {
+                'data_min': self.data_min.tolist(),
+                'data_max': self.data_max.tolist(),
+                'feature_range': list(self.feature_range)
+            },
+            'threshold': self.threshold,
+            'percentile': self.percentile,
+            'model_fingerprint': self.model_fingerprint,
+            'data_fingerprint': self.data_fingerprint,
+            'rows': self.rows,
+            'reference_days': self.reference_days,
+            'trained_rows': self.trained_rows
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        scaler = payload['scaler']
+        return cls(
+            payload['features'],
+            scaler['data_min'],
+            scaler['data_max'],
+            payload['threshold'],
+            percentile=payload.get('percentile', 95),
+            feature_range=scaler.get('feature_range', (0.0, 1.0)),
+            model_fingerprint=payload.get('model_fingerprint'),
+            data_fingerprint=payload.get('data_fingerprint'),
+            rows=payload.get('rows', 0),
+            reference_days=payload.get('reference_days'),
+            trained_rows=payload.get('trained_rows')
+        )
+
+
+def save_model_bundle(bundle, model_path=MODEL_PATH):
+    """Write the bundle next to the model, replacing any previous one atomically."""
+    path = bundle_path(model_path)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(bundle.to_dict(), f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_model_bundle(model_path=MODEL_PATH):
+    """Restore the bundle saved next to the model, or None if there is none."""
+    try:
+        with open(bundle_path(model_path)) as f:
+            payload = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if payload.get('version') != BUNDLE_VERSION:
+        return None
+    return ModelBundle.from_dict(payload)
+
+
+def calibrate_threshold(bundle, employee_df, errors, data_fingerprint, model_path=MODEL_PATH):
+    """
+    Recompute the threshold from the population's reconstruction errors for
+    a new data version and save it, keeping the scaler untouched.
+    """
+    reference_mask = reference_window_mask(employee_df, bundle.reference_days)
+    bundle.threshold = population_threshold(errors, bundle.percentile, reference_mask)
+    bundle.data_fingerprint = data_fingerprint
+    bundle.rows = len(errors)
+    save_model_bundle(bundle, model_path)
+    return bundle.threshold
+
+
+def fit_model_bundle(employee_df, autoencoder, model_path=MODEL_PATH, data_fingerprint=None,
+                     features=FEATURES, percentile=95, reference_days=None, batch_size=4096):
+    """
+    Fit the scaler and anomaly threshold on a behaviour frame and save them
+    next to the model. This is the only place the scaler is ever fitted.
+    """
+    X = employee_df[features].to_numpy(dtype=np.float64)
+    bundle = ModelBundle(
+        features,
+        X.min(axis=0),
+        X.max(axis=0),
+        threshold=0.0,
+        percentile=percentile,
+        model_fingerprint=file_fingerprint(model_path),
+        reference_days=reference_days,
+        # Taken as the data the model was trained on
+        trained_rows=len(employee_df)
+    )
+
+    errors = reconstruction_errors(bundle.transform(X), autoencoder, batch_size)
+    calibrate_threshold(bundle, employee_df, errors, data_fingerprint, model_path)
+    return bundle
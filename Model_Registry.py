@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from Behaviour_Data import DATA_PATH, load_behaviour_data, data_fingerprint, file_fingerprint
+from Scoring_Engine import FEATURES, PopulationScores, reconstruction_errors, squared_errors
+from Model_Bundle import MODEL_PATH, ModelBundle, load_model_bundle, calibrate_threshold
+from Numpy_Autoencoder import load_scoring_model, export_autoencoder
+from Quantile_Sketch import ThresholdSketches
+
+REGISTRY_VERSION = 1
+INDEX_NAME = 'registry.json'
+GROUP_KEYS = ['Department', 'Role']
+
+
+def registry_dir(model_path):
+    """Return the directory of per-group models that sits next to the global model."""
+    root, _ = os.path.splitext(model_path)
+    return root + '.models'
+
+
+def registry_index_path(model_path):
+    return os.path.join(registry_dir(model_path), INDEX_NAME)
+
+
+def group_codes(employee_df):
+    """
+    Return each row's group code and the (Department, Role) of every code;
+    rows missing either key get code -1.
+    """
+    complete = employee_df[GROUP_KEYS].notna().all(axis=1).to_numpy()
+    codes = np.full(len(employee_df), -1, dtype=np.int64)
+    codes[complete], groups = pd.factorize(
+        pd.MultiIndex.from_arrays([employee_df[key].to_numpy()[complete] for key in GROUP_KEYS]))
+    return codes, list(groups)
+
+
+def _slug(department, role):
+    return re.sub(r'[^A-Za-z0-9]+', '_', f'{department}__{role}').strip('_')
+
+
+def _model_bytes(autoencoder):
+    """Memory held by a loaded model's parameters."""
+    return sum(array.nbytes for array in autoencoder.weights + autoencoder.biases)
+
+
+class ModelRegistry:
+    """
+    Autoencoders keyed by (Department, Role), with the global model as the
+    fallback for groups that have none. Models are loaded on first use into
+    an LRU cache capped at `memory_budget` bytes of parameters, so a worker
+    only holds the models of the groups it actually scores.
+
+    Group models use the NumPy backend and carry their own bundle (scaler
+    and threshold), calibrated on that group's rows. A group model whose
+    file no longer matches its bundle is dropped and the group falls back
+    to the global model.
+    """
+
+    def __init__(self, model_path=MODEL_PATH, memory_budget=256 * 2**20):
+        self.model_path = model_path
+        self.directory = registry_dir(model_path)
+        self.memory_budget = memory_budget
+        self.paths = self._read_index()
+        self._cache = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale = []
+
+    def _read_index(self):
+        try:
+            with open(registry_index_path(self.model_path)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if index.get('version') != REGISTRY_VERSION:
+            return {}
+        return {
+            (entry['Department'], entry['Role']): os.path.join(self.directory, entry['path'])
+            for entry in index['models']
+        }
+
+    def resolve(self, department, role):
+        """Return the key of the model that scores a group: its own, or None for the global model."""
+        key = (department, role)
+        return key if key in self.paths else None
+
+    def get(self, department, role):
+        """Return (autoencoder, bundle) for a group, loading it if needed."""
+        return self._load(self.resolve(department, role))
+
+    def _load(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key][:2]
+
+        path = self.model_path if key is None else self.paths.get(key)
+        if path is None:
+            # Another thread found this group's model stale
+            return self._load(None)
+        bundle = load_model_bundle(path)
+        if bundle is None or not bundle.matches_model(path):
+            if key is None:
+                raise ValueError(f"No model bundle matching {path}")
+            with self._lock:
+                if self.paths.pop(key, None) is not None:
+                    self.stale.append(key)
+            return self._load(None)
+        autoencoder = load_scoring_model(path, 'numpy')
+        size = _model_bytes(autoencoder)
+
+        with self._lock:
+            self.misses += 1
+            if key not in self._cache:
+                self._cache[key] = (autoencoder, bundle, size)
+                self._bytes += size
+            self._cache.move_to_end(key)
+            # Evict least recently used models, never the one just asked for
+            while self._bytes > self.memory_budget and len(self._cache) > 1:
+                _, (_, _, evicted_size) = self._cache.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+            return self._cache[key][:2]
+
+    def score_routed(self, X, codes, groups, batch_size=8192):
+        """
+        Score raw feature rows, row i belonging to groups[codes[i]]. Rows
+        are routed to their group's model and every model scores all of its
+        rows in one vectorized predict, so groups that fall back to the
+        global model share a single call, as do rows with code -1 (no
+        group). Returns (errors, thresholds, terms), terms being the float32
+        per-feature squared errors.
+        """
+        errors = np.empty(len(X), dtype=np.float64)
+        thresholds = np.empty(len(X), dtype=np.float64)
+        terms = np.empty(X.shape, dtype=np.float32)
+        # Code -1 sorts first, so offsets[0]:offsets[1] holds the rows without a group
+        order = np.argsort(codes, kind='stable')
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(np.asarray(codes) + 1, minlength=len(groups) + 1))])
+
+        routed = {None: [order[:offsets[1]]]}
+        for code, (department, role) in enumerate(groups, 1):
+            if offsets[code + 1] > offsets[code]:
+                routed.setdefault(self.resolve(department, role), []).append(order[offsets[code]:offsets[code + 1]])
+        for key, parts in routed.items():
+            rows = np.concatenate(parts)
+            if not len(rows):
+                continue
+            autoencoder, bundle = self._load(key)
+            squares = squared_errors(bundle.transform(X[rows]), autoencoder, batch_size)
+            errors[rows] = np.mean(squares, axis=1)
+            thresholds[rows] = bundle.threshold
+            terms[rows] = squares
+        return errors, thresholds, terms
+
+    def score_frame(self, employee_df, batch_size=8192):
+        """Score every row of a frame with its group's model; returns (errors, thresholds, terms)."""
+        codes, groups = group_codes(employee_df)
+        X = employee_df[FEATURES].to_numpy(dtype=np.float64)
+        return self.score_routed(X, codes, groups, batch_size)
+
+    def score_population(self, employee_df, index=None):
+        """Score the population with per-group models and flag rows against their group's threshold."""
+        errors, thresholds, terms = self.score_frame(employee_df)
+        _, bundle = self._load(None)
+        return PopulationScores(employee_df['Employee_ID'], errors, bundle.threshold, index, bundle,
+                                thresholds=thresholds, terms=terms,
+                                sketches=ThresholdSketches().update(errors, employee_df['Department']))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'registered': len(self.paths),
+                'loaded': len(self._cache),
+                'loaded_bytes': self._bytes,
+                'memory_budget': self.memory_budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'stale': [' / '.join(key) for key in self.stale]
+            }
+
+
+def train_registry(csv_path=DATA_PATH, model_path=MODEL_PATH, min_rows=1000, epochs=30, batch_size=1024,
+                   patience=3, percentile=95, seed=42, verbose=0):
+    """
+    Train one autoencoder per (Department, Role) with at least `min_rows`
+    sessions and write the registry next to the global model. Smaller
+    groups fall back to the global model. Returns one report row per group.
+    """
+    from Train_Autoencoder import build_autoencoder, split_rows, fit_autoencoder, save_model_atomically, tf
+
+    tf.keras.utils.set_random_seed(seed)
+    employee_df = load_behaviour_data(csv_path)
+    fingerprint = data_fingerprint(csv_path)
+    directory = registry_dir(model_path)
+    os.makedirs(directory, exist_ok=True)
+
+    models, report = [], []
+    groups = employee_df.groupby(GROUP_KEYS, observed=True, sort=False).indices
+    for (department, role), positions in groups.items():
+        if len(positions) < min_rows:
+            report.append({'Department': department, 'Role': role, 'Rows': len(positions), 'Status': 'global fallback'})
+            continue
+
+        start = time.perf_counter()
+        group_df = employee_df.iloc[positions]
+        X = group_df[FEATURES].to_numpy(dtype=np.float64)
+        train_rows, validation_rows = split_rows(len(X), 0.1, seed)
+        bundle = ModelBundle(FEATURES, X[train_rows].min(axis=0), X[train_rows].max(axis=0), threshold=0.0,
+                             percentile=percentile, trained_rows=len(X))
+        X_scaled = bundle.transform(X).astype(np.float32)
+
+        autoencoder = build_autoencoder(len(FEATURES))
+        fit_autoencoder(autoencoder, X_scaled[train_rows], X_scaled[validation_rows], epochs, batch_size, patience,
+                        seed, verbose)
+
+        group_path = os.path.join(directory, _slug(department, role) + '.keras')
+        save_model_atomically(autoencoder, group_path)
+        export_autoencoder(group_path)
+        bundle.model_fingerprint = file_fingerprint(group_path)
+        errors = reconstruction_errors(X_scaled, load_scoring_model(group_path, 'numpy'), 65536)
+        calibrate_threshold(bundle, group_df, errors, fingerprint, group_path)
+
+        models.append({'Department': department, 'Role': role, 'path': os.path.basename(group_path), 'rows': len(X)})
+        report.append({'Department': department, 'Role': role, 'Rows': len(positions), 'Status': 'trained',
+                       'Threshold': bundle.threshold, 'Seconds': time.perf_counter() - start})
+
+    index_path = registry_index_path(model_path)
+    with open(f'{index_path}.tmp-{os.getpid()}', 'w') as f:
+        json.dump({'version': REGISTRY_VERSION, 'models': models}, f, indent=2)
+    os.replace(f'{index_path}.tmp-{os.getpid()}', index_path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or benchmark per-(Department, Role) autoencoders.")
+    parser.add_argument('csv_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--model', default=MODEL_PATH, help="Global model; the registry sits next to it")
+    parser.add_argument('--train', action='store_true', help="Train the per-group models")
+    parser.add_argument('--min-rows', type=int, default=1000)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--memory-budget-kb', type=float, default=256 * 1024)
+    args = parser.parse_args()
+
+    if args.train:
+        for row in train_registry(args.csv_path, args.model, args.min_rows, args.epochs):
+            details = f", threshold {row['Threshold']:.5f} in {row['Seconds']:.1f} s" if row['Status'] == 'trained' else ''
+            print(f"{row['Department']} / {row['Role']}: {row['Rows']:,} rows, {row['Status']}{details}")
+
+    registry = ModelRegistry(args.model, int(args.memory_budget_kb * 1024))
+    employee_df = load_behaviour_data(args.csv_path)
+    start = time.perf_counter()
+    errors, thresholds, _ = registry.score_frame(employee_df)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {len(errors):,} rows in {elapsed:.2f} s ({len(errors) / elapsed:,.0f} rows/s), "
+          f"{int((errors > thresholds).sum()):,} flagged")
+    print(json.dumps(registry.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
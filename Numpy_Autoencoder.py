@@ -0,0 +1,134 @@
+import os
+import sys
+import numpy as np
+from Behaviour_Data import file_fingerprint
+
+MODEL_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\autoencoder_model.keras"
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    'sigmoid': lambda x: 1.0 / (1.0 + np.exp(-x)),
+    'tanh': np.tanh,
+    'softplus': lambda x: np.logaddexp(x, 0.0),
+    'elu': lambda x: np.where(x > 0.0, x, np.expm1(np.minimum(x, 0.0)))
+}
+
+
+def npz_path(model_path):
+    """Return the exported weights file that sits next to the model file."""
+    root, _ = os.path.splitext(model_path)
+    return root + '.npz'
+
+
+class NumpyAutoencoder:
+    """
+    Forward pass of a stack of Dense layers in plain NumPy. It exposes the
+    same predict() signature as a Keras model so scoring code can use either.
+    """
+
+    def __init__(self, weights, biases, activations, model_fingerprint=None):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.activations = list(activations)
+        self.model_fingerprint = model_fingerprint
+
+        unknown = set(self.activations) - set(ACTIVATIONS)
+        if unknown:
+            raise ValueError(f"Unsupported activations: {sorted(unknown)}")
+
+    def _forward(self, X):
+        for W, b, activation in zip(self.weights, self.biases, self.activations):
+            X = ACTIVATIONS[activation](X @ W + b)
+        return X
+
+    def predict(self, X, batch_size=4096, verbose=0):
+        """Reconstruct the rows of X in float32, one batch at a time."""
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) <= batch_size:
+            return self._forward(X)
+        return np.concatenate([self._forward(X[i:i + batch_size]) for i in range(0, len(X), batch_size)])
+
+    def matches_model(self, model_path):
+        return self.model_fingerprint == file_fingerprint(model_path)
+
+
+def export_autoencoder(model_path=MODEL_PATH, output_path=None):
+    """
+    Extract the Dense layer weights and activations of a Keras model into a
+    .npz file. TensorFlow is only needed here, never at scoring time.
+    """
+    from tensorflow.keras.models import load_model
+
+    autoencoder = load_model(model_path)
+    arrays = {}
+    activations = []
+    for layer in autoencoder.layers:
+        params = layer.get_weights()
+        if not params:
+            continue
+        if len(params) != 2 or type(layer).__name__ != 'Dense':
+            raise ValueError(f"Layer '{layer.name}' is not a Dense layer with a bias and cannot be exported")
+        arrays[f'W{len(activations)}'] = params[0]
+        arrays[f'b{len(activations)}'] = params[1]
+        activations.append(layer.get_config()['activation'])
+
+    output_path = output_path or npz_path(model_path)
+    np.savez(
+        output_path,
+        activations=np.asarray(activations),
+        model_fingerprint=np.asarray(file_fingerprint(model_path)),
+        **arrays
+    )
+    return autoencoder, output_path
+
+
+def load_numpy_autoencoder(path):
+    """Load an exported .npz as a NumpyAutoencoder."""
+    with np.load(path) as archive:
+        activations = [str(a) for a in archive['activations']]
+        weights = [archive[f'W{i}'] for i in range(len(activations))]
+        biases = [archive[f'b{i}'] for i in range(len(activations))]
+        fingerprint = str(archive['model_fingerprint'])
+    return NumpyAutoencoder(weights, biases, activations, fingerprint)
+
+
+def verify_export(autoencoder, numpy_autoencoder, n_features, rows=1024, atol=1e-5, seed=0):
+    """Compare both backends on random scaled inputs; return the max abs difference."""
+    X = np.random.default_rng(seed).random((rows, n_features), dtype=np.float32)
+    expected = autoencoder.predict(X, verbose=0)
+    max_diff = float(np.max(np.abs(expected - numpy_autoencoder.predict(X))))
+    if max_diff > atol:
+        raise ValueError(f"NumPy reconstruction differs from Keras by {max_diff:.2e} (tolerance {atol:.0e})")
+    return max_diff
+
+
+def load_scoring_model(model_path=MODEL_PATH, backend='numpy'):
+    """
+    Load the autoencoder for scoring. The 'numpy' backend reads the exported
+    weights, exporting them once if they are missing or stale. The 'keras'
+    backend loads the full TensorFlow model.
+    """
+    if backend == 'keras':
+        from tensorflow.keras.models import load_model
+        return load_model(model_path)
+    if backend != 'numpy':
+        raise ValueError(f"Unknown scoring backend: {backend}")
+
+    path = npz_path(model_path)
+    if os.path.exists(path):
+        numpy_autoencoder = load_numpy_autoencoder(path)
+        if numpy_autoencoder.matches_model(model_path):
+            return numpy_autoencoder
+
+    autoencoder, path = export_autoencoder(model_path)
+    numpy_autoencoder = load_numpy_autoencoder(path)
+    verify_export(autoencoder, numpy_autoencoder, autoencoder.input_shape[-1])
+    return numpy_autoencoder
+
+
+if __name__ == "__main__":
+    model_path = sys.argv[1] if len(sys.argv) > 1 else MODEL_PATH
+    autoencoder, path = export_autoencoder(model_path)
+    max_diff = verify_export(autoencoder, load_numpy_autoencoder(path), autoencoder.input_shape[-1])
+    print(f"Exported {model_path} to {path} (max abs difference {max_diff:.2e})")
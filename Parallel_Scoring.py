@@ -0,0 +1,285 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from Behaviour_Data import DATA_PATH, load_behaviour_data
+from Scoring_Engine import PopulationScores, reconstruction_errors, squared_errors
+from Model_Bundle import MODEL_PATH, ModelBundle, load_model_bundle
+from Numpy_Autoencoder import load_scoring_model
+from Model_Registry import ModelRegistry, group_codes
+from Quantile_Sketch import ThresholdSketches
+
+# Per-process state of a scoring worker, set once by _init_worker
+_worker = {}
+
+
+def _attach(name, shape, dtype):
+    """Map a shared memory block created by the parent as an array; the parent unlinks it."""
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _init_worker(model_path, backend, bundle_payload, features_spec, errors_spec, terms_spec=None, registry_spec=None,
+                 sketch_spec=None):
+    _worker['features_block'], _worker['features'] = _attach(*features_spec)
+    _worker['errors_block'], _worker['errors'] = _attach(*errors_spec)
+    if terms_spec is not None:
+        _worker['terms_block'], _worker['terms'] = _attach(*terms_spec)
+    if sketch_spec is not None:
+        departments, department_codes_spec = sketch_spec
+        _worker['departments'] = np.asarray(list(departments) + [None], dtype=object)
+        _worker['department_codes_block'], _worker['department_codes'] = _attach(*department_codes_spec)
+    if registry_spec is None:
+        _worker['autoencoder'] = load_scoring_model(model_path, backend)
+        _worker['bundle'] = ModelBundle.from_dict(bundle_payload)
+        return
+    # Group models are loaded on demand, so a worker only holds those of its shards
+    memory_budget, groups, codes_spec, thresholds_spec = registry_spec
+    _worker['registry'] = ModelRegistry(model_path, memory_budget)
+    _worker['groups'] = groups
+    _worker['codes_block'], _worker['codes'] = _attach(*codes_spec)
+    _worker['thresholds_block'], _worker['thresholds'] = _attach(*thresholds_spec)
+
+
+def _score_shard(label, rows, batch_size):
+    """
+    Score one shard in a worker and write its errors into the shared
+    output. When sketching, the shard's error sketches are returned to be
+    merged by the parent.
+    """
+    start = time.perf_counter()
+    X = _worker['features'][rows]
+    if 'registry' in _worker:
+        errors, thresholds, terms = _worker['registry'].score_routed(
+            X, _worker['codes'][rows], _worker['groups'], batch_size
+        )
+        _worker['thresholds'][rows] = thresholds
+    else:
+        terms = squared_errors(_worker['bundle'].transform(X), _worker['autoencoder'], batch_size)
+        errors = np.mean(terms, axis=1)
+    _worker['errors'][rows] = errors
+    if 'terms' in _worker:
+        _worker['terms'][rows] = terms
+    sketches = None
+    if 'departments' in _worker:
+        # Code -1 (no Department) picks the trailing None, not the last department
+        departments = _worker['departments'][_worker['department_codes'][rows]]
+        sketches = ThresholdSketches().update(errors, departments).to_dict()
+    return label, len(errors), time.perf_counter() - start, sketches
+
+
+def make_shards(employee_df, shard_by='rows', shard_rows=250_000):
+    """
+    Split the population into (label, rows) shards. 'rows' gives contiguous
+    row ranges as slices; 'Department' gives each department's row
+    positions and 'model' each (Department, Role) group's, split further so
+    no shard exceeds `shard_rows`. Rows missing the key get shards of their
+    own.
+    """
+    if shard_by == 'rows':
+        return [
+            (f'rows {start}-{min(start + shard_rows, len(employee_df))}', slice(start, start + shard_rows))
+            for start in range(0, len(employee_df), shard_rows)
+        ]
+    if shard_by == 'model':
+        codes, groups = group_codes(employee_df)
+        groups = [' / '.join(group) for group in groups]
+    else:
+        codes, groups = pd.factorize(employee_df[shard_by])
+    # Rows missing the key have code -1, so they sort first into group 0
+    order = np.argsort(codes, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes + 1, minlength=len(groups) + 1))])
+    shards = []
+    missing = 'no Department / Role' if shard_by == 'model' else f'no {shard_by}'
+    for code, group in enumerate([missing] + list(groups)):
+        positions = order[offsets[code]:offsets[code + 1]]
+        for part, start in enumerate(range(0, len(positions), shard_rows)):
+            shards.append((f'{group} #{part}', positions[start:start + shard_rows]))
+    return shards
+
+
+def _shared_array(blocks, shape, dtype):
+    """Create a shared memory block holding an array; the caller unlinks every block in `blocks`."""
+    block = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1))
+    blocks.append(block)
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf), (block.name, shape, dtype)
+
+
+def _parallel_scores(employee_df, bundle, model_path, workers, backend, shard_by, shard_rows, batch_size,
+                     on_shard, registry_budget, keep_terms, keep_sketches=False):
+    workers = workers or os.cpu_count()
+    X = employee_df[bundle.features].to_numpy(dtype=np.float64)
+    blocks = []
+    try:
+        features, features_spec = _shared_array(blocks, X.shape, np.float64)
+        features[:] = X
+        del X
+        errors, errors_spec = _shared_array(blocks, (len(features),), np.float64)
+        terms, terms_spec = None, None
+        if keep_terms:
+            terms, terms_spec = _shared_array(blocks, features.shape, np.float32)
+
+        thresholds, registry_spec = None, None
+        if registry_budget is not None:
+            codes, groups = group_codes(employee_df)
+            shared_codes, codes_spec = _shared_array(blocks, codes.shape, codes.dtype)
+            shared_codes[:] = codes
+            thresholds, thresholds_spec = _shared_array(blocks, (len(features),), np.float64)
+            registry_spec = (registry_budget, groups, codes_spec, thresholds_spec)
+
+        sketches, sketch_spec = None, None
+        if keep_sketches:
+            sketches = ThresholdSketches()
+            department_codes, departments = pd.factorize(employee_df['Department'])
+            shared_department_codes, department_codes_spec = _shared_array(
+                blocks, department_codes.shape, department_codes.dtype
+            )
+            shared_department_codes[:] = department_codes
+            sketch_spec = (list(departments), department_codes_spec)
+
+        initargs = (model_path, backend, bundle.to_dict(), features_spec, errors_spec, terms_spec, registry_spec,
+                    sketch_spec)
+        shards = dict(make_shards(employee_df, shard_by, shard_rows))
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=initargs) as pool:
+            futures = [pool.submit(_score_shard, label, rows, batch_size) for label, rows in shards.items()]
+            for future in as_completed(futures):
+                label, _, _, shard_sketches = future.result()
+                if shard_sketches is not None:
+                    sketches.merge(ThresholdSketches.from_dict(shard_sketches))
+                if on_shard is not None:
+                    on_shard(label, shards[label], errors[shards[label]])
+
+        # Copy out before the shared blocks go away
+        errors, thresholds, terms = (None if array is None else array.copy() for array in (errors, thresholds, terms))
+        return errors, thresholds, terms, sketches
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+
+def parallel_errors(employee_df, bundle, model_path=MODEL_PATH, workers=None, backend='numpy',
+                    shard_by='rows', shard_rows=250_000, batch_size=8192, on_shard=None):
+    """
+    Compute every row's reconstruction error across a pool of worker
+    processes. The raw feature matrix and the error array live in shared
+    memory, so shards travel as slices or position arrays and results are
+    written in place rather than pickled back. Each worker loads the model
+    once. `on_shard(label, rows, errors)` is called as shards finish.
+    """
+    errors, _, _, _ = _parallel_scores(employee_df, bundle, model_path, workers, backend, shard_by, shard_rows,
+                                       batch_size, on_shard, None, False)
+    return errors
+
+
+def parallel_registry_scores(employee_df, bundle, model_path=MODEL_PATH, workers=None, memory_budget=256 * 2**20,
+                             shard_by='model', shard_rows=250_000, batch_size=8192, on_shard=None):
+    """
+    Like parallel_errors, but each row is scored by its (Department, Role)
+    model from the ModelRegistry next to `model_path`. Sharding by 'model'
+    keeps every group on one worker, so each worker loads only the models
+    of the shards it receives. Returns (errors, thresholds).
+    """
+    errors, thresholds, _, _ = _parallel_scores(employee_df, bundle, model_path, workers, 'numpy', shard_by,
+                                                shard_rows, batch_size, on_shard, memory_budget, False)
+    return errors, thresholds
+
+
+def score_population_parallel(employee_df, bundle, model_path=MODEL_PATH, workers=None, backend='numpy',
+                              shard_by='rows', index=None, registry_budget=None):
+    """
+    Parallel counterpart of score_population for a frame with a model
+    bundle, or of ModelRegistry.score_population with `registry_budget`.
+    Each worker sketches its shards' errors and the sketches are merged.
+    """
+    if registry_budget is not None:
+        backend, shard_by = 'numpy', 'model'
+    errors, thresholds, terms, sketches = _parallel_scores(employee_df, bundle, model_path, workers, backend,
+                                                           shard_by, 250_000, 8192, None, registry_budget, True,
+                                                           True)
+    return PopulationScores(employee_df['Employee_ID'], errors, bundle.threshold, index, bundle,
+                            thresholds=thresholds, terms=terms, sketches=sketches)
+
+
+def scaling_report(employee_df, bundle, model_path=MODEL_PATH, max_workers=None, backend='numpy',
+                   shard_by='rows', shard_rows=250_000):
+    """
+    Time full-population scoring in-process and with 1..max_workers worker
+    processes. Times include pool start-up and model loading, as a nightly
+    rescoring run would see them.
+    """
+    max_workers = max_workers or os.cpu_count()
+    autoencoder = load_scoring_model(model_path, backend)
+
+    start = time.perf_counter()
+    reference = reconstruction_errors(bundle.transform_frame(employee_df), autoencoder, 8192)
+    serial_seconds = time.perf_counter() - start
+    rows = [{'Workers': 0, 'Seconds': serial_seconds, 'Rows_Per_Sec': len(employee_df) / serial_seconds,
+             'Speedup': 1.0, 'Max_Abs_Diff': 0.0}]
+
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        errors = parallel_errors(employee_df, bundle, model_path, workers, backend, shard_by, shard_rows)
+        seconds = time.perf_counter() - start
+        rows.append({
+            'Workers': workers,
+            'Seconds': seconds,
+            'Rows_Per_Sec': len(employee_df) / seconds,
+            'Speedup': serial_seconds / seconds,
+            'Max_Abs_Diff': float(np.max(np.abs(errors - reference)))
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the behaviour population across worker processes.")
+    parser.add_argument('csv_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--backend', default='numpy', choices=['numpy', 'keras'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--shard-by', default='rows', choices=['rows', 'Department', 'model'])
+    parser.add_argument('--shard-rows', type=int, default=250_000)
+    parser.add_argument('--tile', type=int, default=1, help="Repeat the population this many times to benchmark larger volumes")
+    parser.add_argument('--report', action='store_true', help="Measure rows/sec for 1..N workers")
+    parser.add_argument('--registry-budget-kb', type=float, default=None,
+                        help="Score with the per-(Department, Role) models, caching this many KB of weights per worker")
+    args = parser.parse_args()
+
+    bundle = load_model_bundle(args.model)
+    if bundle is None:
+        sys.exit(f"No model bundle next to {args.model}; open the dashboard once or fit one first.")
+
+    employee_df = load_behaviour_data(args.csv_path)
+    if args.tile > 1:
+        employee_df = pd.concat([employee_df] * args.tile, ignore_index=True)
+
+    if args.report:
+        report = scaling_report(employee_df, bundle, args.model, args.workers, args.backend, args.shard_by, args.shard_rows)
+        print(f"Rows: {len(employee_df):,} (0 workers = in-process)")
+        print(report.to_string(index=False, float_format=lambda value: f'{value:,.4g}'))
+        return
+
+    on_shard = lambda label, rows, shard_errors: print(f"  {label}: {len(shard_errors):,} rows")
+    start = time.perf_counter()
+    if args.registry_budget_kb is not None:
+        errors, thresholds = parallel_registry_scores(
+            employee_df, bundle, args.model, args.workers, int(args.registry_budget_kb * 1024), args.shard_by,
+            args.shard_rows, on_shard=on_shard
+        )
+    else:
+        errors = parallel_errors(
+            employee_df, bundle, args.model, args.workers, args.backend, args.shard_by, args.shard_rows,
+            on_shard=on_shard
+        )
+        thresholds = bundle.threshold
+    elapsed = time.perf_counter() - start
+    print(f"Scored {len(errors):,} rows in {elapsed:.2f} s ({len(errors) / elapsed:,.0f} rows/s), "
+          f"{int((errors > thresholds).sum()):,} above threshold")
+
+
+if __name__ == "__main__":
+    main()
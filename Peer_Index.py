@@ -0,0 +1,165 @@
+import sys
+import time
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from Lazy_Imports import lazy_import
+from Behaviour_Data import DATA_PATH, load_behaviour_data
+from Model_Bundle import MODEL_PATH, load_model_bundle
+from Employee_Store import EmployeeStore
+
+# Only loaded when the first index is built
+scipy_spatial = lazy_import('scipy.spatial')
+
+
+class PeerIndex:
+    """
+    Nearest behavioural peers of an employee, across departments: a KD-tree
+    over the scaled feature vector of every employee's latest session.
+
+    sync() keeps it current with the EmployeeStore. A new store or model
+    bundle rebuilds it; sessions appended to the same store only move their
+    employees into a small buffer that is searched by brute force, with
+    their old tree points masked out. The tree is rebuilt from the vectors
+    it already holds once the buffer outgrows `rebuild_ratio` of it, so
+    updates cost time proportional to the new sessions.
+    """
+
+    def __init__(self, rebuild_ratio=0.05, min_buffer=64, leafsize=32):
+        self.rebuild_ratio = rebuild_ratio
+        self.min_buffer = min_buffer
+        self.leafsize = leafsize
+        self.store = None
+        self.bundle = None
+        self.rows = 0
+        self.builds = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.tree_of) + len(self.buffer_of)
+
+    def sync(self, employee_store, bundle):
+        """Bring the index up to date with the store; return 'built', 'updated' or 'current'."""
+        with self._lock:
+            if employee_store is not self.store or bundle is not self.bundle:
+                self._build(employee_store, bundle)
+                return 'built'
+            if len(employee_store) > self.rows:
+                self._update()
+                return 'updated'
+            return 'current'
+
+    def _vectors(self, positions):
+        return self.bundle.transform_frame(self.store.take(np.asarray(positions, dtype=np.int64)))
+
+    def _build(self, employee_store, bundle):
+        self.store, self.bundle = employee_store, bundle
+        self.rows = len(employee_store)
+        employee_ids, positions = employee_store.index.latest_positions()
+        self._build_tree(np.asarray(employee_ids, dtype=object), self._vectors(positions))
+
+    def _build_tree(self, employee_ids, X):
+        self.tree = scipy_spatial.cKDTree(X, leafsize=self.leafsize, balanced_tree=False, compact_nodes=False)
+        self.tree_ids = employee_ids
+        self.tree_of = {employee_id: i for i, employee_id in enumerate(employee_ids.tolist())}
+        self.alive = np.ones(len(employee_ids), dtype=bool)
+        self.buffer_ids = []
+        self.buffer_of = {}
+        self.buffer_X = np.empty((0, X.shape[1]), dtype=np.float64)
+        self.builds += 1
+
+    def _update(self):
+        new_rows = self.store.take(np.arange(self.rows, len(self.store)))
+        self.rows = len(self.store)
+        employee_ids = pd.unique(new_rows['Employee_ID'])
+        X = self._vectors([self.store.index.latest(employee_id) for employee_id in employee_ids])
+
+        added = []
+        for employee_id, x in zip(employee_ids, X):
+            i = self.tree_of.pop(employee_id, None)
+            if i is not None:
+                self.alive[i] = False
+            j = self.buffer_of.get(employee_id)
+            if j is None:
+                self.buffer_of[employee_id] = len(self.buffer_ids)
+                self.buffer_ids.append(employee_id)
+                added.append(x)
+            else:
+                self.buffer_X[j] = x
+        if added:
+            self.buffer_X = np.vstack([self.buffer_X, added])
+
+        if len(self.buffer_ids) > max(self.min_buffer, self.rebuild_ratio * len(self.tree_ids)):
+            alive = np.flatnonzero(self.alive)
+            self._build_tree(
+                np.concatenate([self.tree_ids[alive], np.asarray(self.buffer_ids, dtype=object)]),
+                np.vstack([self.tree.data[alive], self.buffer_X])
+            )
+
+    def vector(self, employee_id):
+        """Return the scaled feature vector the employee is indexed by, or None if unknown."""
+        i = self.tree_of.get(employee_id)
+        if i is not None:
+            return self.tree.data[i]
+        i = self.buffer_of.get(employee_id)
+        return None if i is None else self.buffer_X[i]
+
+    def query_vector(self, x, k=5, exclude=None):
+        """Return the k employees nearest to a scaled feature vector as (Employee_ID, Distance) rows."""
+        with self._lock:
+            # Masked-out points are at most as many as buffered employees
+            dead = len(self.alive) - len(self.tree_of)
+            wanted = min(len(self.tree_ids), k + 1 + dead)
+            distances, rows = self.tree.query(x, k=wanted) if wanted else (np.empty(0), np.empty(0, dtype=np.int64))
+            distances, rows = np.atleast_1d(distances), np.atleast_1d(rows)
+            keep = self.alive[rows]
+            ids = self.tree_ids[rows[keep]]
+            distances = distances[keep]
+
+            if self.buffer_ids:
+                ids = np.concatenate([ids, np.asarray(self.buffer_ids, dtype=object)])
+                distances = np.concatenate([distances, np.sqrt(((self.buffer_X - x) ** 2).sum(axis=1))])
+
+        if exclude is not None:
+            keep = ids != exclude
+            ids, distances = ids[keep], distances[keep]
+        nearest = np.argsort(distances, kind='stable')[:k]
+        return pd.DataFrame({'Employee_ID': ids[nearest], 'Distance': distances[nearest]})
+
+    def peers(self, employee_id, k=5):
+        """Return the k employees behaving most like this one, nearest first; None if unknown."""
+        x = self.vector(employee_id)
+        if x is None:
+            return None
+        return self.query_vector(x, k, exclude=employee_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the nearest-peer index and time peer queries.")
+    parser.add_argument('csv_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--queries', type=int, default=10_000)
+    parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    bundle = load_model_bundle(args.model)
+    if bundle is None:
+        sys.exit(f"No model bundle next to {args.model}; open the dashboard once or fit one first.")
+    store = EmployeeStore(load_behaviour_data(args.csv_path))
+
+    index = PeerIndex()
+    start = time.perf_counter()
+    index.sync(store, bundle)
+    print(f"Indexed {len(index):,} employees from {len(store):,} sessions in {time.perf_counter() - start:.3f} s")
+
+    employee_ids = np.random.default_rng(0).choice(index.tree_ids, args.queries)
+    start = time.perf_counter()
+    for employee_id in employee_ids:
+        index.peers(employee_id, args.k)
+    elapsed = time.perf_counter() - start
+    print(f"{args.queries:,} peer queries (k={args.k}): {elapsed / args.queries * 1e6:,.1f} us per query")
+
+
+if __name__ == "__main__":
+    main()
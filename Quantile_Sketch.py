@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+SKETCH_VERSION = 1
+
+# Compactor size; rank error is roughly 1.7 / k
+SKETCH_K = 400
+
+
+def sketch_path(model_path):
+    """Return the threshold sketch file that sits next to the model file."""
+    root, _ = os.path.splitext(model_path)
+    return root + '.sketches.json'
+
+
+class KLLSketch:
+    """
+    Streaming quantile sketch (KLL). Values enter the bottom compactor;
+    a compactor over its capacity is sorted and every other item, from a
+    random offset, moves up a level with twice the weight. Capacities
+    shrink by 2/3 per level below the top, so memory stays under 3k
+    items however many values are seen, and rank error within about 1.7 / k.
+
+    Sketches of disjoint streams merge level by level, so workers can
+    sketch their shards and the parent combines them.
+    """
+
+    def __init__(self, k=SKETCH_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.min = np.inf
+        self.max = -np.inf
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def retained(self):
+        return sum(len(items) for items in self.levels)
+
+    def _capacity(self, level):
+        return max(2, int(np.ceil(self.k * (2 / 3) ** (len(self.levels) - level - 1))))
+
+    def update(self, values):
+        """Add a batch of values; NaNs are skipped."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.n += len(values)
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+        return self
+
+    def _compress(self):
+        # Lazy compaction: only while the sketch as a whole is over budget,
+        # and always the lowest full compactor, so upper levels stay filled
+        while self.retained > sum(self._capacity(level) for level in range(len(self.levels))):
+            level = next(level for level, items in enumerate(self.levels) if len(items) >= self._capacity(level))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind so weights are conserved
+            odd = len(items) % 2
+            promoted = items[odd:][self._rng.integers(2)::2]
+            self.levels[level] = items[:odd]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def merge(self, other):
+        """Fold another sketch into this one."""
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantile(self, q):
+        """Estimated q-quantile (0..1) of everything seen, or None when empty."""
+        if not self.n:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** level) for level, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        i = min(int(np.searchsorted(cumulative, q * cumulative[-1], side='left')), len(values) - 1)
+        return float(values[order][i])
+
+    def percentile(self, percentile):
+        return self.quantile(percentile / 100)
+
+    def to_dict(self):
+        return {
+            'k': self.k,
+            'n': self.n,
+            'min': self.min if self.n else None,
+            'max': self.max if self.n else None,
+            'levels': [items.tolist() for items in self.levels]
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        sketch = cls(payload['k'])
+        sketch.n = payload['n']
+        sketch.min = payload['min'] if payload['min'] is not None else np.inf
+        sketch.max = payload['max'] if payload['max'] is not None else -np.inf
+        sketch.levels = [np.asarray(items, dtype=np.float64) for items in payload['levels']] or [np.empty(0)]
+        return sketch
+
+
+class ThresholdSketches:
+    """
+    Reconstruction-error sketches for the whole population and per
+    Department, updated batch by batch as errors are produced, so anomaly
+    thresholds track a stream in bounded memory without re-sorting it.
+    """
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.overall = KLLSketch(k)
+        self.departments = {}
+
+    def update(self, errors, departments=None):
+        """Add a batch of errors, with each row's Department when known."""
+        errors = np.asarray(errors, dtype=np.float64)
+        self.overall.update(errors)
+        if departments is None or not len(errors):
+            return self
+        codes, uniques = pd.factorize(np.asarray(departments, dtype=object))
+        # Rows without a Department sort first and only count towards the overall sketch
+        order = np.argsort(codes, kind='stable')
+        groups = np.split(order, np.cumsum(np.bincount(codes + 1, minlength=len(uniques) + 1))[:-1])
+        for department, rows in zip(uniques, groups[1:]):
+            self.departments.setdefault(department, KLLSketch(self.k)).update(errors[rows])
+        return self
+
+    def merge(self, other):
+        self.overall.merge(other.overall)
+        for department, sketch in other.departments.items():
+            self.departments.setdefault(department, KLLSketch(self.k)).merge(sketch)
+        return self
+
+    def threshold(self, department=None, percentile=95):
+        """Streaming percentile of the errors, overall or for one department; None if none seen."""
+        sketch = self.overall if department is None else self.departments.get(department)
+        return None if sketch is None else sketch.percentile(percentile)
+
+    def to_dict(self):
+        return {
+            'version': SKETCH_VERSION,
+            'k': self.k,
+            'overall': self.overall.to_dict(),
+            'departments': {department: sketch.to_dict() for department, sketch in self.departments.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        if payload.get('version') != SKETCH_VERSION:
+            raise ValueError("Unsupported sketch version")
+        sketches = cls(payload['k'])
+        sketches.overall = KLLSketch.from_dict(payload['overall'])
+        sketches.departments = {
+            department: KLLSketch.from_dict(sketch) for department, sketch in payload['departments'].items()
+        }
+        return sketches
+
+
+def save_sketches(sketches, path):
+    """Write the sketches to disk under a temporary name and move them into place."""
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(sketches.to_dict(), f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_sketches(path):
+    """Read sketches written by save_sketches, or None if the file is missing or unreadable."""
+    try:
+        with open(path) as f:
+            return ThresholdSketches.from_dict(json.load(f))
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show, merge or benchmark streaming threshold sketches.")
+    parser.add_argument('paths', nargs='*', help="Sketch files to merge and show")
+    parser.add_argument('--output', help="Write the merged sketches here")
+    parser.add_argument('--percentile', type=float, default=95)
+    parser.add_argument('--bench', type=int, metavar='VALUES', help="Stream this many synthetic errors and compare with np.percentile")
+    parser.add_argument('--batch', type=int, default=100_000)
+    parser.add_argument('-k', type=int, default=SKETCH_K)
+    args = parser.parse_args()
+
+    if args.bench:
+        rng = np.random.default_rng(0)
+        departments = np.array(['HR', 'IT', 'Sales', 'Finance'], dtype=object)
+        scales = np.array([0.05, 0.08, 0.06, 0.04])
+        shards = [ThresholdSketches(args.k) for _ in range(4)]
+        kept_errors, kept_departments = [], []
+        start = time.perf_counter()
+        for i, offset in enumerate(range(0, args.bench, args.batch)):
+            rows = min(args.batch, args.bench - offset)
+            codes = rng.integers(0, len(departments), rows)
+            batch_departments = departments[codes]
+            errors = rng.lognormal(np.log(scales[codes]), 0.6)
+            shards[i % len(shards)].update(errors, batch_departments)
+            kept_errors.append(errors)
+            kept_departments.append(batch_departments)
+        elapsed = time.perf_counter() - start
+        merged = ThresholdSketches(args.k)
+        for shard in shards:
+            merged.merge(shard)
+
+        errors, batch_departments = np.concatenate(kept_errors), np.concatenate(kept_departments)
+        print(f"{args.bench:,} errors in {elapsed:.2f} s incl. generation ({args.bench / elapsed:,.0f} values/s), "
+              f"{len(shards)} shard sketches merged, {merged.overall.retained:,} values retained overall")
+        for department in [None] + sorted(merged.departments):
+            exact_errors = errors if department is None else errors[batch_departments == department]
+            exact = np.percentile(exact_errors, args.percentile)
+            estimate = merged.threshold(department, args.percentile)
+            rank = (exact_errors <= estimate).mean() * 100
+            print(f"  {department or 'All':8} p{args.percentile:g}: exact {exact:.5f}, sketch {estimate:.5f} "
+                  f"(rank {rank:.2f})")
+        return
+
+    merged = None
+    for path in args.paths:
+        sketches = load_sketches(path)
+        if sketches is None:
+            parser.error(f"Cannot read sketches from {path}")
+        merged = sketches if merged is None else merged.merge(sketches)
+    if merged is None:
+        parser.error("Pass sketch files or --bench")
+    for department in [None] + sorted(merged.departments):
+        sketch = merged.overall if department is None else merged.departments[department]
+        print(f"{department or 'All':8} {sketch.n:>12,} errors, p{args.percentile:g} {merged.threshold(department, args.percentile):.5f}")
+    if args.output:
+        save_sketches(merged, args.output)
+
+
+if __name__ == "__main__":
+    main()
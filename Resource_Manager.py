@@ -0,0 +1,195 @@
+import os
+import weakref
+import threading
+from contextlib import ExitStack, contextmanager
+
+
+def _file_signature(paths):
+    """(mtime, size) of every watched file; None for files that are missing."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def _close(value):
+    """Give dropped resources that own threads or handles a chance to stop."""
+    close = getattr(value, 'close', None)
+    if callable(close):
+        close()
+
+
+class _Entry:
+    def __init__(self, loader, watch_paths):
+        self.loader = loader
+        self.watch_paths = tuple(watch_paths)
+        self.lock = threading.RLock()
+        self.value = None
+        self.loaded = False
+        self.signature = None
+        self.version = 0
+        self.refcount = 0
+
+
+class ResourceLease:
+    """
+    A session's hold on a shared resource. The hold is released when the
+    lease is released explicitly or garbage-collected with its session.
+    """
+
+    def __init__(self, manager, name):
+        self.name = name
+        self._manager = manager
+        self._finalizer = weakref.finalize(self, manager.release, name)
+
+    @property
+    def value(self):
+        return self._manager.get(self.name)
+
+    def release(self):
+        self._finalizer()
+
+
+class ResourceManager:
+    """
+    Process-wide singleton that holds one copy of each heavy resource (data
+    snapshot, model, population scores) for every Streamlit session.
+
+    Resources are registered with a loader and the files they depend on.
+    A resource is rebuilt on access when any watched file has changed or
+    after an explicit invalidate(), and dropped when its last lease is
+    released. Dropped values that have a close() method are closed.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        if ResourceManager._instance is not None:
+            raise Exception("ResourceManager is a singleton!")
+        ResourceManager._instance = self
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    @staticmethod
+    def get_instance():
+        if ResourceManager._instance is None:
+            with ResourceManager._instance_lock:
+                if ResourceManager._instance is None:
+                    ResourceManager()
+        return ResourceManager._instance
+
+    def register(self, name, loader, watch_paths=()):
+        """Register a resource once; later registrations of the same name are ignored."""
+        with self._lock:
+            if name not in self._entries:
+                self._entries[name] = _Entry(loader, watch_paths)
+
+    def _entry(self, name):
+        with self._lock:
+            if name not in self._entries:
+                raise KeyError(f"Resource '{name}' is not registered")
+            return self._entries[name]
+
+    def get(self, name):
+        """Return the current value, rebuilding it if a watched file changed."""
+        entry = self._entry(name)
+        with entry.lock:
+            # Take the signature before loading so a change during the load
+            # is picked up on the next access
+            signature = _file_signature(entry.watch_paths)
+            if not entry.loaded or signature != entry.signature:
+                _close(entry.value)
+                entry.value = entry.loader()
+                entry.signature = signature
+                entry.loaded = True
+                entry.version += 1
+            return entry.value
+
+    def apply(self, name, update, signature=None, expected=None):
+        """
+        Update a loaded resource in place with `update(value)` and mark it
+        current for the watched files' `signature` (taken before the update
+        read them), so an append that was already folded in does not
+        trigger a full rebuild. Returns False, without calling `update`, if
+        the resource is not loaded or is no longer the `expected` object.
+        """
+        entry = self._entry(name)
+        with entry.lock:
+            if not entry.loaded or (expected is not None and entry.value is not expected):
+                return False
+            update(entry.value)
+            if signature is not None:
+                entry.signature = signature
+            entry.version += 1
+            return True
+
+    @contextmanager
+    def hold(self, *names):
+        """
+        Block access to the named resources, in the given order, for the
+        duration of the block, e.g. while the files they load are replaced.
+        Name dependents before what they load, as their loaders do.
+        """
+        with ExitStack() as stack:
+            for name in names:
+                stack.enter_context(self._entry(name).lock)
+            yield
+
+    def swap(self, name, value):
+        """
+        Install a freshly built value in one step, marked current for the
+        watched files as they are now. Leases see it on their next access.
+        """
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.value is not value:
+                _close(entry.value)
+            entry.value = value
+            entry.signature = _file_signature(entry.watch_paths)
+            entry.loaded = True
+            entry.version += 1
+
+    def watch_signature(self, name):
+        """Return the current signature of a resource's watched files."""
+        return _file_signature(self._entry(name).watch_paths)
+
+    def acquire(self, name):
+        """Take a lease on a resource and make sure it is loaded."""
+        entry = self._entry(name)
+        with entry.lock:
+            entry.refcount += 1
+        self.get(name)
+        return ResourceLease(self, name)
+
+    def release(self, name):
+        """Drop one lease; the value is freed once nobody holds it."""
+        entry = self._entry(name)
+        with entry.lock:
+            entry.refcount = max(entry.refcount - 1, 0)
+            if entry.refcount == 0:
+                _close(entry.value)
+                entry.value = None
+                entry.loaded = False
+
+    def invalidate(self, name=None):
+        """Force one resource, or all of them, to be rebuilt on next access."""
+        with self._lock:
+            entries = list(self._entries.values()) if name is None else [self._entries[name]]
+        for entry in entries:
+            with entry.lock:
+                _close(entry.value)
+                entry.value = None
+                entry.loaded = False
+
+    def stats(self):
+        """Return refcount, version and load state per resource."""
+        with self._lock:
+            items = list(self._entries.items())
+        return {
+            name: {'refcount': entry.refcount, 'version': entry.version, 'loaded': entry.loaded}
+            for name, entry in items
+        }
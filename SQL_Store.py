@@ -0,0 +1,436 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from Behaviour_Data import DATA_PATH, load_behaviour_data, data_fingerprint, parse_timestamps, apply_schema
+from Scoring_Engine import FEATURES, FeatureContributions, squared_errors
+from Travel_Detector import detect_travel, impossible_travel
+from Quantile_Sketch import ThresholdSketches
+
+SQL_STORE_PATH = r"C:\Users\Nitya\Downloads\SentinelSecure\Employee_Behaviour.sqlite3"
+
+# Bump whenever the tables change so old stores get reloaded
+STORE_VERSION = 3
+
+# Columns of the behaviour log as stored in the sessions table. Timestamps
+# are ISO text so they sort and compare correctly in SQL.
+SESSION_COLUMNS = [
+    ('Employee_ID', 'TEXT'),
+    ('Department', 'TEXT'),
+    ('Role', 'TEXT'),
+    ('Login_Timestamp', 'TEXT'),
+    ('Logout_Timestamp', 'TEXT'),
+    ('File_Access_Timestamp', 'TEXT'),
+    ('File_Access_Frequency', 'INTEGER'),
+    ('Access_Anomaly_Flag', 'INTEGER'),
+    ('Suspicious_Activity_Flag', 'INTEGER'),
+    ('Work_Duration', 'REAL'),
+    ('Idle_Time', 'REAL'),
+    ('VPN_Usage', 'INTEGER'),
+    ('Behavior_Label', 'TEXT'),
+    ('Latitude', 'REAL'),
+    ('Longitude', 'REAL')
+]
+TIMESTAMP_COLUMNS = ['Login_Timestamp', 'Logout_Timestamp', 'File_Access_Timestamp']
+BEHAVIOR_LABELS = ['Normal', 'Suspicious', 'Critical']
+
+TABLES = f"""
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS sessions (
+    row_id INTEGER PRIMARY KEY,
+    {', '.join(f'{name} {kind}' for name, kind in SESSION_COLUMNS)}
+);
+CREATE TABLE IF NOT EXISTS scores (
+    row_id INTEGER PRIMARY KEY,
+    Reconstruction_Error REAL,
+    Threshold REAL,
+    Is_Anomaly INTEGER
+);
+CREATE TABLE IF NOT EXISTS employees (
+    Employee_ID TEXT PRIMARY KEY,
+    Department TEXT,
+    first_row INTEGER
+);
+CREATE TABLE IF NOT EXISTS session_counts (
+    Department TEXT, Role TEXT, Behavior_Label TEXT, Access_Anomaly_Flag INTEGER, Rows INTEGER,
+    PRIMARY KEY (Department, Role, Behavior_Label, Access_Anomaly_Flag)
+);
+CREATE TABLE IF NOT EXISTS feature_sums (
+    Department TEXT, Role TEXT, Rows INTEGER,
+    {', '.join(f'{feature} REAL' for feature in FEATURES)},
+    PRIMARY KEY (Department, Role)
+);
+"""
+
+# Created after a bulk load rather than maintained row by row during it
+INDEXES = {
+    'idx_sessions_employee': 'sessions (Employee_ID, Login_Timestamp)',
+    'idx_sessions_department_role': 'sessions (Department, Role)',
+    'idx_sessions_label': 'sessions (Behavior_Label)',
+    'idx_sessions_login': 'sessions (Login_Timestamp)',
+    'idx_employees_department': 'employees (Department, first_row)'
+}
+
+
+def _column_values(series):
+    """Convert one frame column to plain Python values sqlite3 can bind."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        series = series.dt.strftime('%Y-%m-%d %H:%M:%S')
+    elif pd.api.types.is_bool_dtype(series):
+        series = series.astype(np.int64)
+    values = series.astype(object)
+    return values.where(series.notna(), None).tolist()
+
+
+def _to_frame(sessions_df):
+    """Turn rows read from the sessions table back into the app's frame layout."""
+    sessions_df = sessions_df.drop(columns='row_id')
+    for column in TIMESTAMP_COLUMNS:
+        sessions_df[column] = pd.to_datetime(sessions_df[column], format='ISO8601')
+    sessions_df['VPN_Usage'] = sessions_df['VPN_Usage'].astype(bool)
+    return apply_schema(parse_timestamps(sessions_df))
+
+
+class BehaviourSQLStore:
+    """
+    The behaviour log, its scores and its per-department aggregates in one
+    SQLite file, indexed on Employee_ID, Department, Role, Behavior_Label
+    and login time. Lookups read a few indexed rows instead of filtering
+    the whole frame, and several dashboard processes can share the file.
+
+    The connection is shared by the threads of one process; every call
+    holds a lock for its duration.
+    """
+
+    def __init__(self, db_path=SQL_STORE_PATH):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(db_path, timeout=60, check_same_thread=False, isolation_level=None)
+        # WAL lets other processes keep reading while one reloads the store
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(TABLES)
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def meta(self):
+        return dict(self._query('SELECT key, value FROM meta'))
+
+    def is_current_for(self, csv_path):
+        """True if the store was loaded from the CSV as it is now."""
+        meta = self.meta()
+        if meta.get('version') != str(STORE_VERSION):
+            return False
+        stat = os.stat(csv_path)
+        if meta.get('source_size') != str(stat.st_size):
+            return False
+        if meta.get('source_mtime_ns') == str(stat.st_mtime_ns):
+            return True
+        return meta.get('source_sha256') == data_fingerprint(csv_path)
+
+    def bulk_load(self, employee_df, meta, chunk_rows=50_000, csv_path=None):
+        """
+        Replace the whole store with `employee_df` in one transaction. Rows
+        are inserted with executemany in chunks, and the summary tables and
+        indexes are built afterwards in SQL. With `csv_path`, nothing is
+        written if another process has meanwhile loaded that CSV version.
+        Returns True if the store was replaced.
+        """
+        names = [name for name, _ in SESSION_COLUMNS]
+        insert = f"INSERT INTO sessions (row_id, {', '.join(names)}) VALUES ({', '.join('?' * (len(names) + 1))})"
+        feature_sums = ', '.join(f'SUM({feature})' for feature in FEATURES)
+
+        with self._lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            if csv_path is not None and self.is_current_for(csv_path):
+                cursor.execute('ROLLBACK')
+                return False
+            try:
+                for index in INDEXES:
+                    cursor.execute(f'DROP INDEX IF EXISTS {index}')
+                for table in ('meta', 'sessions', 'scores', 'employees', 'session_counts', 'feature_sums'):
+                    cursor.execute(f'DELETE FROM {table}')
+
+                for start in range(0, len(employee_df), chunk_rows):
+                    chunk = employee_df.iloc[start:start + chunk_rows]
+                    columns = [range(start, start + len(chunk))] + [_column_values(chunk[name]) for name in names]
+                    cursor.executemany(insert, zip(*columns))
+
+                # SQLite takes the bare Department from the row holding MIN(row_id)
+                cursor.execute(
+                    'INSERT INTO employees SELECT Employee_ID, Department, MIN(row_id) FROM sessions GROUP BY Employee_ID'
+                )
+                cursor.execute(
+                    'INSERT INTO session_counts SELECT Department, Role, Behavior_Label, Access_Anomaly_Flag, COUNT(*) '
+                    'FROM sessions GROUP BY Department, Role, Behavior_Label, Access_Anomaly_Flag'
+                )
+                cursor.execute(
+                    f'INSERT INTO feature_sums SELECT Department, Role, COUNT(*), {feature_sums} '
+                    'FROM sessions GROUP BY Department, Role'
+                )
+                for index, target in INDEXES.items():
+                    cursor.execute(f'CREATE INDEX {index} ON {target}')
+
+                meta = dict(meta, version=STORE_VERSION, rows=len(employee_df))
+                cursor.executemany('INSERT INTO meta VALUES (?, ?)', [(key, str(value)) for key, value in meta.items()])
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+        self.connection.execute('ANALYZE')
+        return True
+
+    def save_scores(self, errors, threshold, thresholds=None, scored_with=None, sketches=None, contributions=None):
+        """
+        Replace the stored reconstruction errors, thresholds and anomaly
+        flags. Pass `thresholds` when rows are flagged against their own
+        thresholds. `scored_with` names the model and data the scores come
+        from, and the error sketches and department contributions are kept
+        with them, all in the same transaction.
+        """
+        errors = np.asarray(errors, dtype=np.float64)
+        thresholds = np.full(len(errors), float(threshold)) if thresholds is None else np.asarray(thresholds, dtype=np.float64)
+        meta = {'threshold': float(threshold), 'scored_with': scored_with}
+        if sketches is not None:
+            meta['sketches'] = json.dumps(sketches.to_dict())
+        if contributions is not None:
+            meta['contributions'] = json.dumps(contributions.to_dict())
+        with self._lock:
+            cursor = self.connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                cursor.execute('DELETE FROM scores')
+                cursor.executemany(
+                    'INSERT INTO scores VALUES (?, ?, ?, ?)',
+                    zip(range(len(errors)), errors.tolist(), thresholds.tolist(), (errors > thresholds).tolist())
+                )
+                cursor.execute("DELETE FROM meta WHERE key IN ('scored_with', 'sketches', 'contributions')")
+                cursor.executemany(
+                    'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                    [(key, str(value)) for key, value in meta.items() if value is not None]
+                )
+                cursor.execute('COMMIT')
+            except BaseException:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def scored_with(self):
+        """What the stored scores were computed with, as passed to save_scores, or None."""
+        return self.meta().get('scored_with')
+
+    def sketches(self):
+        """The error sketches saved with the scores, or None."""
+        payload = self.meta().get('sketches')
+        return None if payload is None else ThresholdSketches.from_dict(json.loads(payload))
+
+    def contributions(self):
+        """The per-department feature contributions saved with the scores, or None."""
+        payload = self.meta().get('contributions')
+        return None if payload is None else FeatureContributions.from_dict(json.loads(payload))
+
+    def read_frame(self):
+        """Return every session as a frame in the same layout load_behaviour_data gives."""
+        with self._lock:
+            sessions_df = pd.read_sql_query('SELECT * FROM sessions ORDER BY row_id', self.connection)
+        employee_df = _to_frame(sessions_df)
+        employee_df.attrs['source_size'] = int(self.meta()['source_size'])
+        return employee_df
+
+    def iter_frames(self, chunk_rows=100_000):
+        """Yield the sessions in row order, `chunk_rows` at a time, in the layout read_frame gives."""
+        for start in range(0, int(self.meta().get('rows', 0)), chunk_rows):
+            with self._lock:
+                sessions_df = pd.read_sql_query(
+                    'SELECT * FROM sessions WHERE row_id >= ? AND row_id < ? ORDER BY row_id',
+                    self.connection, params=(start, start + chunk_rows)
+                )
+            yield _to_frame(sessions_df)
+
+    def departments(self):
+        """Departments in the order they first appear in the data."""
+        rows = self._query('SELECT Department FROM employees GROUP BY Department ORDER BY MIN(first_row)')
+        return [department for department, in rows]
+
+    def employee_ids(self, department):
+        rows = self._query('SELECT Employee_ID FROM employees WHERE Department = ? ORDER BY first_row', (department,))
+        return np.array([employee_id for employee_id, in rows], dtype=object)
+
+    def department_kpis(self, department):
+        """Return the department's totals, label counts and anomaly rate."""
+        rows = self._query(
+            'SELECT Behavior_Label, SUM(Rows), SUM(Rows * Access_Anomaly_Flag) FROM session_counts '
+            'WHERE Department = ? GROUP BY Behavior_Label',
+            (department,)
+        )
+        if not rows:
+            raise KeyError(department)
+        by_label = {label: (rows_, anomalies) for label, rows_, anomalies in rows}
+        kpis = {label: int(by_label.get(label, (0, 0))[0]) for label in BEHAVIOR_LABELS}
+        kpis['Total'] = int(sum(rows_ for rows_, _ in by_label.values()))
+        kpis['Anomalies'] = int(sum(anomalies for _, anomalies in by_label.values()))
+        kpis['Anomaly_Rate'] = kpis['Anomalies'] / kpis['Total'] * 100
+        return kpis
+
+    def department_feature_means(self, department):
+        sums = ', '.join(f'SUM({feature})' for feature in FEATURES)
+        rows = self._query(f'SELECT SUM(Rows), {sums} FROM feature_sums WHERE Department = ?', (department,))
+        total, *feature_sums = rows[0]
+        if not total:
+            raise KeyError(department)
+        return pd.Series(feature_sums, index=FEATURES, dtype=np.float64) / total
+
+    def employee_rows(self, employee_id, start=None, end=None, last=None):
+        """
+        Return the employee's sessions in login order with their stored
+        Reconstruction_Error, Threshold and Is_Anomaly (NaN until scored),
+        optionally only those logged in within [start, end) and only the
+        `last` most recent of those. Served by the (Employee_ID,
+        Login_Timestamp) index.
+        """
+        sql = (
+            'SELECT se.*, sc.Reconstruction_Error, sc.Threshold, sc.Is_Anomaly '
+            'FROM sessions se LEFT JOIN scores sc ON sc.row_id = se.row_id WHERE se.Employee_ID = ?'
+        )
+        params = [employee_id]
+        if start is not None:
+            sql += ' AND se.Login_Timestamp >= ?'
+            params.append(pd.Timestamp(start).strftime('%Y-%m-%d %H:%M:%S'))
+        if end is not None:
+            sql += ' AND se.Login_Timestamp < ?'
+            params.append(pd.Timestamp(end).strftime('%Y-%m-%d %H:%M:%S'))
+        sql += ' ORDER BY se.Login_Timestamp DESC, se.row_id DESC'
+        if last is not None:
+            sql += ' LIMIT ?'
+            params.append(int(last))
+        with self._lock:
+            sessions_df = pd.read_sql_query(sql, self.connection, params=params)
+        return _to_frame(sessions_df.iloc[::-1].reset_index(drop=True))
+
+    def row(self, employee_id):
+        """Return the employee's latest session as a Series, or None if unknown."""
+        sessions_df = self.employee_rows(employee_id, last=1)
+        return sessions_df.iloc[0] if len(sessions_df) else None
+
+    def lookup(self, employee_id):
+        """
+        Return the stored score of an employee's latest session, with the
+        distance and time from the session before it, or None.
+        """
+        sessions_df = self.employee_rows(employee_id, last=2)
+        if not len(sessions_df) or pd.isna(sessions_df['Reconstruction_Error'].iloc[-1]):
+            return None
+        distance_km, hours = (float(values[-1]) for values in detect_travel(sessions_df))
+        return {
+            'Reconstruction_Error': float(sessions_df['Reconstruction_Error'].iloc[-1]),
+            'Is_Anomaly': bool(sessions_df['Is_Anomaly'].iloc[-1]),
+            'Travel_Km': distance_km,
+            'Travel_Hours': hours,
+            'Impossible_Travel': bool(impossible_travel(distance_km, hours))
+        }
+
+
+class StoreScores:
+    """
+    The scores kept in a BehaviourSQLStore, seen through the parts of
+    PopulationScores the dashboard reads. Lookups go to the store one
+    employee at a time; the error sketches and department contributions
+    are read once, when the scores are opened.
+    """
+
+    def __init__(self, store, bundle):
+        self.store = store
+        self.bundle = bundle
+        self.threshold = bundle.threshold
+        self.features = list(bundle.features)
+        self.sketches = store.sketches()
+        self.contributions = store.contributions()
+
+    def lookup(self, employee_id):
+        return self.store.lookup(employee_id)
+
+
+def score_store(store, autoencoder, bundle, registry=None, chunk_rows=100_000, batch_size=8192):
+    """
+    Score every stored session with the global model, or with the group
+    models of a ModelRegistry, reading `chunk_rows` sessions at a time so
+    the table is never loaded whole. The error sketches and per-Department
+    contributions are folded in chunk by chunk. Returns (errors,
+    thresholds, login times, sketches, contributions); thresholds is None
+    with the global model.
+    """
+    errors, thresholds, logins = [], [], []
+    sketches, contributions = ThresholdSketches(), FeatureContributions(bundle.features)
+    for chunk in store.iter_frames(chunk_rows):
+        if registry is None:
+            terms = squared_errors(bundle.transform_frame(chunk), autoencoder, batch_size)
+            chunk_errors = np.mean(terms, axis=1)
+        else:
+            chunk_errors, chunk_thresholds, terms = registry.score_frame(chunk, batch_size)
+            thresholds.append(chunk_thresholds)
+        errors.append(chunk_errors)
+        logins.append(chunk['Login_Timestamp'].to_numpy())
+        sketches.update(chunk_errors, chunk['Department'])
+        contributions.add(chunk['Department'], terms)
+    return (
+        np.concatenate(errors),
+        np.concatenate(thresholds) if thresholds else None,
+        np.concatenate(logins),
+        sketches,
+        contributions
+    )
+
+
+def load_sql_store(csv_path=DATA_PATH, db_path=SQL_STORE_PATH):
+    """
+    Open the SQLite store, bulk loading it from the CSV when it is missing
+    or stale. Concurrent processes serialise on the write lock and only
+    the first one reloads.
+    """
+    store = BehaviourSQLStore(db_path)
+    if store.is_current_for(csv_path):
+        return store
+
+    stat = os.stat(csv_path)
+    employee_df = load_behaviour_data(csv_path)
+    meta = {
+        'source_size': employee_df.attrs.get('source_size', stat.st_size),
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_sha256': data_fingerprint(csv_path)
+    }
+    store.bulk_load(employee_df, meta, csv_path=csv_path)
+    return store
+
+
+if __name__ == "__main__":
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else DATA_PATH
+    db_path = sys.argv[2] if len(sys.argv) > 2 else SQL_STORE_PATH
+
+    start = time.perf_counter()
+    store = load_sql_store(csv_path, db_path)
+    print(f"Store ready in {time.perf_counter() - start:.2f} s ({store.meta()['rows']} rows)")
+
+    department = store.departments()[0]
+    employee_id = store.employee_ids(department)[0]
+    for label, query in [
+        ('departments', store.departments),
+        ('employee_ids', lambda: store.employee_ids(department)),
+        ('department_kpis', lambda: store.department_kpis(department)),
+        ('department_feature_means', lambda: store.department_feature_means(department)),
+        ('employee_rows', lambda: store.employee_rows(employee_id)),
+    ]:
+        runs = 200
+        start = time.perf_counter()
+        for _ in range(runs):
+            query()
+        print(f"{label:<26} {(time.perf_counter() - start) / runs * 1e3:.3f} ms")
@@ -0,0 +1,373 @@
+import numpy as np
+import pandas as pd
+from Lazy_Imports import lazy_import
+from Employee_Store import EmployeeIndex
+from Travel_Detector import impossible_travel
+from Quantile_Sketch import ThresholdSketches
+
+# Only needed when scoring without a model bundle
+sklearn_preprocessing = lazy_import('sklearn.preprocessing')
+
+FEATURES = ['Work_Duration', 'Idle_Time', 'File_Access_Frequency', 'VPN_Usage', 'Latitude', 'Longitude']
+
+
+class FeatureContributions:
+    """
+    Running per-group sums of every feature's squared error and of its
+    share of each row's error, so a group's mean contributions are one
+    read however many rows it has. add() folds in new rows in time
+    proportional to them.
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        self.row_of = {}
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.term_sums = np.zeros((0, len(self.features)))
+        self.share_sums = np.zeros((0, len(self.features)))
+
+    def add(self, groups, terms):
+        terms = np.asarray(terms, dtype=np.float64)
+        codes, labels = pd.factorize(np.asarray(groups, dtype=object))
+        # Rows without a group or without a breakdown are skipped
+        kept = (codes >= 0) & ~np.isnan(terms).any(axis=1)
+        for label in labels:
+            self.row_of.setdefault(label, len(self.row_of))
+        grown = len(self.row_of) - len(self.counts)
+        if grown:
+            self.counts = np.concatenate([self.counts, np.zeros(grown, dtype=np.int64)])
+            self.term_sums = np.vstack([self.term_sums, np.zeros((grown, len(self.features)))])
+            self.share_sums = np.vstack([self.share_sums, np.zeros((grown, len(self.features)))])
+
+        rows = np.array([self.row_of[label] for label in labels], dtype=np.int64)[codes[kept]]
+        terms = terms[kept]
+        totals = terms.sum(axis=1, keepdims=True)
+        shares = np.divide(terms, totals, out=np.zeros_like(terms), where=totals > 0)
+        self.counts += np.bincount(rows, minlength=len(self.counts))
+        for j in range(len(self.features)):
+            self.term_sums[:, j] += np.bincount(rows, weights=terms[:, j], minlength=len(self.counts))
+            self.share_sums[:, j] += np.bincount(rows, weights=shares[:, j], minlength=len(self.counts))
+        return self
+
+    def mean(self, group, shares=False):
+        """
+        Mean squared error of every feature over the group's rows, or with
+        `shares` the mean of the rows' shares; None for an unknown group.
+        """
+        row = self.row_of.get(group)
+        if row is None or not self.counts[row]:
+            return None
+        sums = self.share_sums if shares else self.term_sums
+        return pd.Series(sums[row] / self.counts[row], index=self.features)
+
+    def frame(self, shares=False):
+        """Every group's means as a frame indexed by group with a column per feature."""
+        sums = self.share_sums if shares else self.term_sums
+        return pd.DataFrame(sums / self.counts[:, None], index=list(self.row_of), columns=self.features)
+
+    def to_dict(self):
+        return {
+            'features': self.features,
+            'groups': list(self.row_of),
+            'counts': self.counts.tolist(),
+            'term_sums': self.term_sums.tolist(),
+            'share_sums': self.share_sums.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        contributions = cls(payload['features'])
+        width = len(contributions.features)
+        contributions.row_of = {group: row for row, group in enumerate(payload['groups'])}
+        contributions.counts = np.asarray(payload['counts'], dtype=np.int64)
+        contributions.term_sums = np.asarray(payload['term_sums'], dtype=np.float64).reshape(-1, width)
+        contributions.share_sums = np.asarray(payload['share_sums'], dtype=np.float64).reshape(-1, width)
+        return contributions
+
+
+class PopulationScores:
+    """
+    Reconstruction errors and anomaly flags for a whole population, stored
+    in arrays aligned with the rows of the scored frame. Pass the frame's
+    EmployeeIndex to share it instead of building another one.
+
+    The arrays grow by doubling, so appending newly scored rows costs time
+    proportional to the new rows only.
+
+    Rows scored by different models (see Model_Registry) carry their own
+    threshold in `thresholds`; `threshold` is then the global fallback's.
+
+    `terms` keeps the per-feature squared errors behind every row's error
+    as float32, so explanations need no second model call. set_travel()
+    adds the distance and time from each session to the employee's
+    previous one, from which impossible travel is flagged.
+
+    `sketches` holds streaming quantile sketches of the errors, overall and
+    per Department; appended rows are folded in, so the population's error
+    percentiles stay current without re-sorting every error. Likewise
+    track_contributions() keeps per-Department FeatureContributions.
+    """
+
+    def __init__(self, employee_ids, errors, threshold, index=None, bundle=None, thresholds=None, terms=None,
+                 sketches=None):
+        self._errors = np.asarray(errors, dtype=np.float64)
+        self._size = len(self._errors)
+        self.threshold = float(threshold)
+        self._thresholds = None if thresholds is None else np.asarray(thresholds, dtype=np.float64)
+        self._flags = self._errors > self._limits()
+        self._terms = None if terms is None else np.asarray(terms, dtype=np.float32)
+        self._travel = None
+        self.index = index if index is not None else EmployeeIndex(employee_ids)
+        self.bundle = bundle
+        self.features = list(bundle.features) if bundle is not None else FEATURES
+        self.sketches = sketches
+        self.contributions = None
+
+    @property
+    def errors(self):
+        return self._errors[:self._size]
+
+    @property
+    def flags(self):
+        return self._flags[:self._size]
+
+    @property
+    def terms(self):
+        """Per-feature squared errors, one row per session, or None when not kept."""
+        return None if self._terms is None else self._terms[:self._size]
+
+    @property
+    def travel_km(self):
+        return None if self._travel is None else self._travel[:self._size, 0]
+
+    @property
+    def travel_hours(self):
+        return None if self._travel is None else self._travel[:self._size, 1]
+
+    @property
+    def travel_flags(self):
+        """Sessions reached from the previous one faster than possible, or None without travel."""
+        return None if self._travel is None else impossible_travel(self.travel_km, self.travel_hours)
+
+    def set_travel(self, distance_km, hours):
+        """Attach the travel of every scored row, e.g. from Travel_Detector.detect_travel."""
+        self._travel = np.empty((len(self._errors), 2), dtype=np.float32)
+        self._travel[:self._size, 0] = distance_km
+        self._travel[:self._size, 1] = hours
+
+    def revise_travel(self, positions, distance_km, hours):
+        """Replace the travel of scored rows, e.g. those Travel_Detector.append_travel revised."""
+        if self._travel is not None and len(positions):
+            self._travel[positions, 0] = distance_km
+            self._travel[positions, 1] = hours
+
+    @property
+    def thresholds(self):
+        """Per-row thresholds, or None when every row uses `threshold`."""
+        return None if self._thresholds is None else self._thresholds[:self._size]
+
+    def _limits(self):
+        return self.threshold if self._thresholds is None else self._thresholds
+
+    def set_threshold(self, threshold):
+        """Re-flag every row against a new threshold without rescoring."""
+        self.threshold = float(threshold)
+        self._thresholds = None
+        self._flags = self._errors > self.threshold
+
+    def append(self, errors, employee_ids=None, thresholds=None, terms=None, travel=None, departments=None):
+        """
+        Add the scores of rows appended to the scored frame. Pass their
+        Employee_IDs only when the index is not shared with an EmployeeStore
+        that already indexed them. With per-row thresholds, rows appended
+        without `thresholds` are flagged against `threshold`; rows appended
+        without `terms` or `travel` (distance km, hours) have none (NaN).
+        The errors go into the sketches, per Department when `departments`
+        is given, and the terms into the tracked contributions, which need
+        `departments`.
+        """
+        errors = np.asarray(errors, dtype=np.float64)
+        start = self._size
+        needed = start + len(errors)
+        if needed > len(self._errors):
+            capacity = max(needed, 2 * len(self._errors))
+            grown = np.empty(capacity, dtype=np.float64)
+            grown[:start] = self._errors[:start]
+            self._errors = grown
+            grown_flags = np.zeros(capacity, dtype=bool)
+            grown_flags[:start] = self._flags[:start]
+            self._flags = grown_flags
+            if self._thresholds is not None:
+                grown_thresholds = np.empty(capacity, dtype=np.float64)
+                grown_thresholds[:start] = self._thresholds[:start]
+                self._thresholds = grown_thresholds
+            if self._terms is not None:
+                grown_terms = np.empty((capacity, self._terms.shape[1]), dtype=np.float32)
+                grown_terms[:start] = self._terms[:start]
+                self._terms = grown_terms
+            if self._travel is not None:
+                grown_travel = np.empty((capacity, 2), dtype=np.float32)
+                grown_travel[:start] = self._travel[:start]
+                self._travel = grown_travel
+
+        self._errors[start:needed] = errors
+        if self._thresholds is not None:
+            self._thresholds[start:needed] = self.threshold if thresholds is None else thresholds
+            self._flags[start:needed] = errors > self._thresholds[start:needed]
+        else:
+            self._flags[start:needed] = errors > self.threshold
+        if self._terms is not None:
+            self._terms[start:needed] = np.nan if terms is None else terms
+        if self._travel is not None:
+            self._travel[start:needed] = np.nan if travel is None else np.column_stack(travel)
+        self._size = needed
+        if self.sketches is not None:
+            self.sketches.update(errors, departments)
+        if self.contributions is not None and terms is not None and departments is not None:
+            self.contributions.add(departments, terms)
+        if employee_ids is not None:
+            self.index.append(employee_ids, start)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, employee_id):
+        return employee_id in self.index
+
+    def row_of(self, employee_id):
+        """Return the row position of an employee's latest session, or None if unscored."""
+        return self.index.latest(employee_id)
+
+    def lookup(self, employee_id):
+        """Return the stored score of an employee's latest session without a model call."""
+        i = self.index.latest(employee_id)
+        if i is None:
+            return None
+        score = {
+            'Reconstruction_Error': float(self.errors[i]),
+            'Is_Anomaly': bool(self.flags[i])
+        }
+        if self._travel is not None:
+            distance_km, hours = (float(value) for value in self._travel[i])
+            score.update({
+                'Travel_Km': distance_km,
+                'Travel_Hours': hours,
+                'Impossible_Travel': bool(impossible_travel(distance_km, hours))
+            })
+        return score
+
+    def history(self, employee_id, start=None, end=None):
+        """
+        Return the stored errors and flags of an employee's sessions in
+        login order, optionally only those logged in within [start, end).
+        """
+        positions = self.index.positions(employee_id, start, end)
+        return self.errors[positions], self.flags[positions]
+
+    def top_features(self, positions, k=3):
+        """
+        Rank the features of many rows at once by their share of the row's
+        squared error. Returns (feature positions, shares), both shaped
+        (rows, k), largest first.
+        """
+        terms = self.terms[positions]
+        totals = terms.sum(axis=1, keepdims=True)
+        shares = np.divide(terms, totals, out=np.zeros_like(terms), where=totals > 0)
+        top = np.argsort(-shares, axis=1, kind='stable')[:, :k]
+        return top, np.take_along_axis(shares, top, axis=1)
+
+    def explain(self, employee_id, k=3):
+        """
+        Return the k features contributing most to the error of an
+        employee's latest session, or None if it is unscored or no
+        breakdown was kept.
+        """
+        i = self.index.latest(employee_id)
+        if i is None or self._terms is None:
+            return None
+        top, shares = self.top_features([i], k)
+        return pd.DataFrame({
+            'Feature': [self.features[j] for j in top[0]],
+            'Squared_Error': self.terms[i, top[0]].astype(np.float64),
+            'Share': shares[0].astype(np.float64)
+        })
+
+    def group_contributions(self, groups):
+        """
+        FeatureContributions of the scored rows per group, given each row's
+        group (e.g. the Department column) aligned with them.
+        """
+        # The scores may run ahead of the frame while rows are being followed
+        rows = min(len(groups), self._size)
+        return FeatureContributions(self.features).add(np.asarray(groups, dtype=object)[:rows], self.terms[:rows])
+
+    def track_contributions(self, groups):
+        """
+        Compute the per-group contributions once, e.g. per Department, and
+        keep them current as rows are appended with their `departments`.
+        """
+        if self._terms is not None:
+            self.contributions = self.group_contributions(groups)
+
+
+def squared_errors(X_scaled, autoencoder, batch_size=4096):
+    """Run one batched predict and return every row's per-feature squared error."""
+    reconstructed = autoencoder.predict(X_scaled, batch_size=batch_size, verbose=0)
+    return np.power(X_scaled - reconstructed, 2)
+
+
+def reconstruction_errors(X_scaled, autoencoder, batch_size=4096):
+    """Run one batched predict and return the per-row mean squared error."""
+    return np.mean(squared_errors(X_scaled, autoencoder, batch_size), axis=1)
+
+
+def reference_window_mask(employee_df, days, column='Login_Timestamp'):
+    """
+    Select the rows that fall within the last `days` days of the data, or
+    every row when no window is configured.
+    """
+    if days is None:
+        return None
+    timestamps = employee_df[column]
+    return (timestamps >= timestamps.max() - pd.Timedelta(days=days)).to_numpy()
+
+
+def population_threshold(errors, percentile=95, reference_mask=None):
+    """Take the anomaly threshold as a percentile of the population's errors."""
+    reference = errors if reference_mask is None else errors[reference_mask]
+    return float(np.percentile(reference, percentile))
+
+
+def score_sessions(sessions_df, autoencoder, bundle, batch_size=4096):
+    """
+    Score a set of sessions, e.g. one employee's history over a date range,
+    in a single batched forward pass with the bundle's scaler and threshold.
+    """
+    errors = reconstruction_errors(bundle.transform_frame(sessions_df), autoencoder, batch_size)
+    return pd.DataFrame({
+        'Login_Timestamp': sessions_df['Login_Timestamp'].to_numpy(),
+        'Reconstruction_Error': errors,
+        'Is_Anomaly': errors > bundle.threshold
+    }, index=sessions_df.index)
+
+
+def score_population(employee_df, autoencoder, bundle=None, batch_size=4096, percentile=95, index=None):
+    """
+    Score every row of the behaviour frame in large batches.
+
+    With a model bundle the stored scaler and threshold are reused as-is.
+    Without one the scaler is fitted here and rows whose error exceeds the
+    given percentile of the population's errors are flagged as anomalies.
+    """
+    if bundle is not None:
+        X_scaled = bundle.transform_frame(employee_df)
+    else:
+        X = employee_df[FEATURES].to_numpy(dtype=np.float32)
+        X_scaled = sklearn_preprocessing.MinMaxScaler().fit_transform(X)
+
+    squares = squared_errors(X_scaled, autoencoder, batch_size)
+    errors = np.mean(squares, axis=1)
+    threshold = bundle.threshold if bundle is not None else population_threshold(errors, percentile)
+    return PopulationScores(employee_df['Employee_ID'], errors, threshold, index, bundle,
+                            terms=squares.astype(np.float32),
+                            sketches=ThresholdSketches().update(errors, employee_df['Department']))
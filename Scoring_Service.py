@@ -0,0 +1,335 @@
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import logging
+import socketserver
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+from Behaviour_Data import DATA_PATH, load_behaviour_data
+from Scoring_Engine import reconstruction_errors
+from Model_Bundle import MODEL_PATH, load_model_bundle
+from Numpy_Autoencoder import load_scoring_model
+from Quantile_Sketch import ThresholdSketches, load_sketches, save_sketches
+
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8765
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceMetrics:
+    """
+    Rolling window of per-event latencies and batch sizes, plus streaming
+    sketches of every error scored, overall and per Department, so the
+    live error percentiles are known in bounded memory.
+    """
+
+    def __init__(self, window=10_000, sketches=None):
+        self._lock = threading.Lock()
+        self.sketches = sketches if sketches is not None else ThresholdSketches()
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.events = 0
+        self.batches = 0
+        self.anomalies = 0
+        self.started = time.perf_counter()
+
+    def record(self, latencies_ms, anomalies, errors=None, departments=None):
+        with self._lock:
+            if errors is not None:
+                self.sketches.update(errors, departments)
+            self.latencies_ms.extend(latencies_ms)
+            self.batch_sizes.append(len(latencies_ms))
+            self.events += len(latencies_ms)
+            self.batches += 1
+            self.anomalies += anomalies
+
+    def snapshot(self):
+        with self._lock:
+            latencies = np.asarray(self.latencies_ms, dtype=np.float64)
+            sizes = np.asarray(self.batch_sizes, dtype=np.float64)
+            events, batches, anomalies = self.events, self.batches, self.anomalies
+            error_p95 = self.sketches.threshold(percentile=95)
+        elapsed = time.perf_counter() - self.started
+        return {
+            'events': events,
+            'batches': batches,
+            'anomalies': anomalies,
+            'events_per_sec': events / elapsed if elapsed else 0.0,
+            'latency_p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'latency_p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'batch_size_mean': float(sizes.mean()) if len(sizes) else None,
+            'batch_size_p50': float(np.percentile(sizes, 50)) if len(sizes) else None,
+            'batch_size_max': int(sizes.max()) if len(sizes) else None,
+            'error_p95': error_p95
+        }
+
+
+class MicroBatcher:
+    """
+    Coalesces single behaviour events into micro-batches and scores each
+    batch with one forward pass. A batch is closed when it reaches
+    `max_batch` events or when its oldest event has waited `max_delay_ms`,
+    whichever comes first, so load raises throughput without letting
+    latency grow unbounded.
+
+    Every scored event resolves the Future returned by submit() and is
+    passed to each `subscribers` callback, e.g. to raise alerts. Errors
+    are folded into the metrics' sketches by the event's Department, if
+    any; pass `sketches` to carry on from ones saved earlier.
+
+    A batch that fails to score fails its events' Futures and a failing
+    subscriber is logged, so neither stops the batcher thread.
+    """
+
+    def __init__(self, autoencoder, bundle, max_batch=256, max_delay_ms=5.0, subscribers=(), sketches=None):
+        self.autoencoder = autoencoder
+        self.bundle = bundle
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self.subscribers = list(subscribers)
+        self.metrics = ServiceMetrics(sketches=sketches)
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, event):
+        """
+        Queue one event: a mapping with the bundle's features and optionally
+        an Employee_ID, Department and Event_ID. Returns a Future for its
+        score. Raises RuntimeError once the batcher is closed or its thread
+        has died, as the event would never be scored.
+        """
+        if self._stop.is_set() or not self._thread.is_alive():
+            raise RuntimeError("Micro-batcher is not running")
+        future = Future()
+        self._queue.put((time.perf_counter(), event, future))
+        return future
+
+    def _collect(self):
+        """Block for the first event, then gather more until the batch is full or due."""
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = batch[0][0] + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _score(self, batch):
+        features = self.bundle.features
+        valid = []
+        for _, event, future in batch:
+            try:
+                valid.append([float(event[feature]) for feature in features])
+            except (KeyError, TypeError, ValueError) as error:
+                future.set_exception(ValueError(f"Bad event {event!r}: {error}"))
+        if not valid:
+            return
+
+        errors = reconstruction_errors(self.bundle.transform(np.asarray(valid)), self.autoencoder, len(valid))
+        flags = errors > self.bundle.threshold
+        done = time.perf_counter()
+
+        latencies_ms = []
+        scored = [item for item in batch if not item[2].done()]
+        for (submitted, event, future), error, flag in zip(scored, errors.tolist(), flags.tolist()):
+            score = {
+                'Event_ID': event.get('Event_ID'),
+                'Employee_ID': event.get('Employee_ID'),
+                'Reconstruction_Error': error,
+                'Is_Anomaly': flag
+            }
+            latencies_ms.append((done - submitted) * 1000)
+            future.set_result(score)
+            self._publish(score)
+        departments = [event.get('Department') for _, event, _ in scored]
+        self.metrics.record(latencies_ms, int(flags.sum()), errors, departments)
+
+    def _publish(self, score):
+        for subscriber in self.subscribers:
+            try:
+                subscriber(score)
+            except Exception:
+                logger.exception("Score subscriber %r failed", subscriber)
+
+    def _fail_pending(self, error):
+        """Fail the Futures of events still queued, e.g. after close()."""
+        while True:
+            try:
+                _, _, future = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            future.set_exception(error)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+            try:
+                self._score(batch)
+            except Exception as error:
+                logger.exception("Scoring a batch of %d events failed", len(batch))
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+        self._fail_pending(RuntimeError("Micro-batcher is not running"))
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        # Events submitted while the thread was exiting
+        self._fail_pending(RuntimeError("Micro-batcher is not running"))
+
+
+class _EventHandler(socketserver.StreamRequestHandler):
+    """
+    Newline-delimited JSON over a local socket. Each line is an event and
+    gets one score line back, in the order the events were sent; the line
+    {"metrics": true} returns the service metrics instead. Clients can
+    pipeline many events without waiting for each reply.
+    """
+
+    def handle(self):
+        replies = queue.Queue()
+        writer = threading.Thread(target=self._write_replies, args=(replies,), daemon=True)
+        writer.start()
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError as error:
+                replies.put({'error': f"Invalid JSON: {error}"})
+                continue
+            if isinstance(event, dict) and event.get('metrics'):
+                replies.put(self.server.batcher.metrics.snapshot())
+                continue
+            try:
+                replies.put(self.server.batcher.submit(event))
+            except RuntimeError as error:
+                replies.put({'error': str(error)})
+        replies.put(None)
+        writer.join()
+
+    def _write_replies(self, replies):
+        while True:
+            reply = replies.get()
+            if reply is None:
+                return
+            if isinstance(reply, Future):
+                try:
+                    reply = reply.result()
+                except Exception as error:
+                    reply = {'error': str(error)}
+            self.wfile.write(json.dumps(reply).encode() + b'\n')
+
+
+class ScoringService(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, batcher, host=SERVICE_HOST, port=SERVICE_PORT):
+        super().__init__((host, port), _EventHandler)
+        self.batcher = batcher
+
+
+def _alert_writer(path):
+    """Subscriber that appends anomalous scores to a JSON-lines file."""
+    lock = threading.Lock()
+    alerts = open(path, 'a', buffering=1)
+
+    def publish(score):
+        if score['Is_Anomaly']:
+            with lock:
+                alerts.write(json.dumps(score) + '\n')
+    return publish
+
+
+def benchmark(batcher, csv_path, events, clients=8, rate=None):
+    """
+    Replay rows of the behaviour log as events from several client threads,
+    paced to `rate` events per second in total, or as fast as possible.
+    """
+    employee_df = load_behaviour_data(csv_path)
+    columns = ['Employee_ID', 'Department'] + batcher.bundle.features
+    records = employee_df[columns].astype({'Employee_ID': object, 'Department': object}).to_dict('records')
+    interval = clients / rate if rate else 0.0
+
+    def client(offset):
+        futures = []
+        start = time.perf_counter()
+        for n, i in enumerate(range(offset, events, clients)):
+            delay = start + n * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(batcher.submit(dict(records[i % len(records)], Event_ID=i)))
+        for future in futures:
+            future.result()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(offset,)) for offset in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score behaviour events in micro-batches over a local socket.")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--backend', default='numpy', choices=['numpy', 'keras'])
+    parser.add_argument('--host', default=SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=SERVICE_PORT)
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-delay-ms', type=float, default=5.0)
+    parser.add_argument('--alerts', help="Append anomalous scores to this JSON-lines file")
+    parser.add_argument('--sketches', help="Resume the error sketches from this file and save them on exit")
+    parser.add_argument('--bench', type=int, metavar='EVENTS', help="Replay this many events from the CSV instead of serving")
+    parser.add_argument('--rate', type=float, help="Target events/sec for --bench (default: as fast as possible)")
+    parser.add_argument('--csv', default=DATA_PATH)
+    args = parser.parse_args()
+
+    bundle = load_model_bundle(args.model)
+    if bundle is None:
+        sys.exit(f"No model bundle next to {args.model}; open the dashboard once or fit one first.")
+    subscribers = [_alert_writer(args.alerts)] if args.alerts else []
+    sketches = load_sketches(args.sketches) if args.sketches else None
+    batcher = MicroBatcher(load_scoring_model(args.model, args.backend), bundle,
+                           args.max_batch, args.max_delay_ms, subscribers, sketches)
+
+    if args.bench:
+        elapsed = benchmark(batcher, args.csv, args.bench, rate=args.rate)
+        print(f"{args.bench:,} events in {elapsed:.2f} s ({args.bench / elapsed:,.0f} events/s)")
+        print(json.dumps(batcher.metrics.snapshot(), indent=2))
+        batcher.close()
+        if args.sketches:
+            save_sketches(batcher.metrics.sketches, args.sketches)
+        return
+
+    with ScoringService(batcher, args.host, args.port) as server:
+        print(f"Scoring service listening on {args.host}:{args.port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    batcher.close()
+    if args.sketches:
+        save_sketches(batcher.metrics.sketches, args.sketches)
+    print(json.dumps(batcher.metrics.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from Behaviour_Data import DATA_PATH, parse_timestamps, apply_schema
+from Scoring_Engine import FeatureContributions, squared_errors
+from Employee_Store import EmployeeIndex
+from Travel_Detector import detect_travel, impossible_travel
+from Aggregates import BehaviourAggregates
+from Model_Bundle import MODEL_PATH, load_model_bundle
+from Numpy_Autoencoder import load_scoring_model
+from Quantile_Sketch import SKETCH_K, ThresholdSketches, save_sketches
+
+
+class StreamingIngest:
+    """
+    Ingest a behaviour CSV in bounded-size chunks. Each chunk is parsed,
+    scored in one batched forward pass and folded into the department
+    aggregates, the error sketches (overall and per Department), the
+    per-Department feature contributions and a per-employee summary; the
+    chunk itself is then dropped, so memory grows with the number of
+    employees, not with the file size.
+
+    The summary keeps each employee's session count and two latest
+    sessions by login time, with their scores: the latest answers row()
+    and lookup(), the one before it gives the travel into it. With a
+    ModelRegistry every row is scored by its (Department, Role) model.
+    """
+
+    def __init__(self, autoencoder, bundle, chunk_rows=100_000, batch_size=8192, sketch_k=SKETCH_K, registry=None):
+        self.autoencoder = autoencoder
+        self.bundle = bundle
+        self.chunk_rows = chunk_rows
+        self.batch_size = batch_size
+        self.registry = registry
+        self.aggregates = None
+        self.sketches = ThresholdSketches(sketch_k)
+        self.contributions = FeatureContributions(bundle.features)
+        self.session_counts = pd.Series(dtype=np.int64)
+        # The two latest sessions of every employee, and the latest one indexed by Employee_ID
+        self.recent = None
+        self.latest = None
+        self.rows = 0
+        self.anomalies = 0
+
+    @property
+    def threshold(self):
+        return self.bundle.threshold
+
+    @property
+    def features(self):
+        return list(self.bundle.features)
+
+    def score_chunk(self, chunk):
+        """Return the reconstruction errors, anomaly flags and per-feature squared errors of one chunk."""
+        if self.registry is None:
+            terms = squared_errors(self.bundle.transform_frame(chunk), self.autoencoder, self.batch_size)
+            errors = np.mean(terms, axis=1)
+            return errors, errors > self.bundle.threshold, terms
+        errors, thresholds, terms = self.registry.score_frame(chunk, self.batch_size)
+        return errors, errors > thresholds, terms
+
+    def _update_employees(self, chunk, errors, flags):
+        rows = chunk.assign(
+            Employee_ID=chunk['Employee_ID'].to_numpy(dtype=object),
+            Row=np.arange(self.rows, self.rows + len(chunk)),
+            Reconstruction_Error=errors,
+            Is_Anomaly=flags
+        )
+        rows = rows[rows['Employee_ID'].notna()]
+        counts = rows.groupby('Employee_ID', sort=False).size()
+        self.session_counts = self.session_counts.add(counts, fill_value=0).astype(np.int64)
+
+        # Sessions kept from earlier chunks join this one, so travel into a
+        # session is measured from the employee's previous one wherever it
+        # arrived; chunks need not be in login order
+        if self.recent is not None:
+            rows = pd.concat([self.recent[self.recent['Employee_ID'].isin(counts.index)], rows], ignore_index=True)
+        index = EmployeeIndex(rows['Employee_ID'], rows['Login_Timestamp'])
+        rows['Travel_Km'], rows['Travel_Hours'] = detect_travel(rows, index)
+
+        # Only the two latest sessions per employee matter: an older one
+        # arriving later can never become the latest's predecessor
+        group_ends = np.repeat(index.offsets[1:], np.diff(index.offsets))
+        kept = rows.iloc[index.order[np.arange(len(index.order)) >= group_ends - 2]]
+        if self.recent is not None:
+            kept = pd.concat([self.recent[~self.recent['Employee_ID'].isin(counts.index)], kept], ignore_index=True)
+        self.recent = kept.reset_index(drop=True)
+        self.latest = self.recent.drop_duplicates('Employee_ID', keep='last').set_index('Employee_ID', drop=False)
+
+    def consume(self, chunk):
+        """Fold one raw chunk into every running structure; return its scores."""
+        chunk = apply_schema(parse_timestamps(chunk))
+        errors, flags, terms = self.score_chunk(chunk)
+
+        if self.aggregates is None:
+            self.aggregates = BehaviourAggregates.build(chunk)
+        else:
+            self.aggregates.add_rows(chunk)
+        self.sketches.update(errors, chunk['Department'])
+        self.contributions.add(chunk['Department'], terms)
+        self._update_employees(chunk, errors, flags)
+
+        self.rows += len(chunk)
+        self.anomalies += int(flags.sum())
+        return chunk, errors, flags
+
+    def ingest(self, csv_path=DATA_PATH, on_chunk=None):
+        """
+        Stream the whole file. `on_chunk(chunk, errors, flags)` is called for
+        every chunk, e.g. to persist scores, before the chunk is released.
+        """
+        for raw_chunk in pd.read_csv(csv_path, chunksize=self.chunk_rows):
+            chunk, errors, flags = self.consume(raw_chunk)
+            if on_chunk is not None:
+                on_chunk(chunk, errors, flags)
+        return self
+
+    def employee_summary(self, employee_id):
+        latest = self.row(employee_id)
+        if latest is None:
+            return None
+        return {
+            'Sessions': int(self.session_counts[employee_id]),
+            'Last_Row': int(latest['Row']),
+            'Reconstruction_Error': float(latest['Reconstruction_Error']),
+            'Is_Anomaly': bool(latest['Is_Anomaly'])
+        }
+
+    def row(self, employee_id):
+        """Return the employee's latest session by login time, or None if unknown."""
+        if self.latest is None or employee_id not in self.latest.index:
+            return None
+        return self.latest.loc[employee_id]
+
+    def latest_session(self, employee_id):
+        """Return the employee's latest session as a one-row frame, or None if unknown."""
+        if self.latest is None or employee_id not in self.latest.index:
+            return None
+        return self.latest.loc[[employee_id]].reset_index(drop=True)
+
+    def lookup(self, employee_id):
+        """Return the score of an employee's latest session and the travel into it, or None."""
+        latest = self.row(employee_id)
+        if latest is None:
+            return None
+        distance_km, hours = float(latest['Travel_Km']), float(latest['Travel_Hours'])
+        return {
+            'Reconstruction_Error': float(latest['Reconstruction_Error']),
+            'Is_Anomaly': bool(latest['Is_Anomaly']),
+            'Travel_Km': distance_km,
+            'Travel_Hours': hours,
+            'Impossible_Travel': bool(impossible_travel(distance_km, hours))
+        }
+
+    def error_quantile(self, q=0.95, department=None):
+        return self.sketches.threshold(department, q * 100)
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a behaviour CSV through the scorer in bounded chunks.")
+    parser.add_argument('csv_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--chunk-rows', type=int, default=100_000)
+    parser.add_argument('--sketches', help="Save the error sketches to this file")
+    args = parser.parse_args()
+
+    bundle = load_model_bundle(args.model)
+    if bundle is None:
+        sys.exit(f"No model bundle next to {args.model}; open the dashboard once or fit one first.")
+
+    start = time.perf_counter()
+    ingest = StreamingIngest(load_scoring_model(args.model), bundle, chunk_rows=args.chunk_rows)
+    ingest.ingest(args.csv_path)
+    elapsed = time.perf_counter() - start
+
+    print(f"Rows: {ingest.rows} in {elapsed:.2f} s ({ingest.rows / elapsed:,.0f} rows/s)")
+    print(f"Employees: {len(ingest.session_counts)}, anomalies: {ingest.anomalies} (threshold {bundle.threshold:.5f})")
+    print(f"Estimated 95th percentile error: {ingest.error_quantile(0.95):.5f}")
+    for department in sorted(ingest.sketches.departments):
+        print(f"  {department}: {ingest.error_quantile(0.95, department):.5f}")
+    if args.sketches:
+        save_sketches(ingest.sketches, args.sketches)
+    peak = _peak_rss_mb()
+    if peak is not None:
+        print(f"Peak RSS: {peak:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
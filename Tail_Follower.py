@@ -0,0 +1,131 @@
+import io
+import os
+import threading
+import numpy as np
+import pandas as pd
+from Behaviour_Data import DATA_PATH, parse_timestamps, apply_schema
+from Scoring_Engine import squared_errors
+from Travel_Detector import append_travel
+
+# Shared resources that appended rows are folded into, in update order.
+# Scores go first so every row the store indexes already has a score.
+FOLLOWED_RESOURCES = ('population_scores', 'employee_store', 'aggregates')
+
+
+class TailReader:
+    """
+    Reads rows appended to a CSV since a byte offset. Only complete lines
+    are consumed; a partly written last line is left for the next read.
+    """
+
+    def __init__(self, csv_path, offset):
+        self.csv_path = csv_path
+        self.columns = list(pd.read_csv(csv_path, nrows=0).columns)
+        self.offset = offset
+
+    def read_new(self):
+        """
+        Return the rows appended since the last read (possibly empty), or
+        None if the file shrank and the offset no longer means anything.
+        """
+        if os.path.getsize(self.csv_path) < self.offset:
+            return None
+
+        with open(self.csv_path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return pd.DataFrame(columns=self.columns)
+
+        self.offset += end
+        return pd.read_csv(io.BytesIO(data[:end]), header=None, names=self.columns)
+
+
+class LiveFollower:
+    """
+    Follow mode for the shared resources: every `interval` seconds the rows
+    appended to the behaviour CSV are parsed, scored in one micro-batch with
+    the bundle's scaler and the loaded autoencoder, and folded into the
+    store, the population scores and the department aggregates. The work
+    is proportional to the appended rows only.
+
+    If the CSV is truncated or rewritten, or any followed resource is
+    rebuilt, the follower stops and reports itself stale; the resources
+    then reload in full on next access.
+    """
+
+    def __init__(self, manager, csv_path=DATA_PATH, interval=2.0, batch_size=4096):
+        self.manager = manager
+        self.interval = interval
+        self.batch_size = batch_size
+        self.autoencoder = manager.get('autoencoder')
+        self.resources = {name: manager.get(name) for name in FOLLOWED_RESOURCES}
+        store = self.resources['employee_store']
+        self.tail = TailReader(csv_path, store.frame.attrs.get('source_size', os.path.getsize(csv_path)))
+        self.rows_followed = 0
+        self.anomalies_followed = 0
+        self.stale = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='behaviour-tail', daemon=True)
+        self._thread.start()
+
+    def is_following(self, *values):
+        """True while the follower is live and folding into exactly these objects."""
+        return not self.stale and all(
+            any(value is followed for followed in self.resources.values()) for value in values
+        )
+
+    def poll(self):
+        """Fold any newly appended rows in now; return how many were added."""
+        with self._lock:
+            if self.stale:
+                return 0
+            # Taken before reading, so bytes appended meanwhile still count as a change
+            signatures = {name: self.manager.watch_signature(name) for name in FOLLOWED_RESOURCES}
+            raw = self.tail.read_new()
+            if raw is None:
+                self.stale = True
+                return 0
+            if raw.empty:
+                return 0
+
+            rows = apply_schema(parse_timestamps(raw))
+            scores = self.resources['population_scores']
+            terms = squared_errors(scores.bundle.transform_frame(rows), self.autoencoder, self.batch_size)
+            errors = np.mean(terms, axis=1)
+            distance, hours, revised = append_travel(self.resources['employee_store'], rows)
+
+            def update_scores(value):
+                value.append(errors, terms=terms, travel=(distance, hours), departments=rows['Department'])
+                # Stored sessions that now follow a row which arrived out of login order
+                value.revise_travel(*revised)
+
+            updates = {
+                'population_scores': update_scores,
+                'employee_store': lambda value: value.append(rows),
+                'aggregates': lambda value: value.add_rows(rows),
+            }
+            for name in FOLLOWED_RESOURCES:
+                if not self.manager.apply(name, updates[name], signatures[name], expected=self.resources[name]):
+                    # Something was rebuilt underneath us; start over from a full load
+                    self.stale = True
+                    for followed in FOLLOWED_RESOURCES:
+                        self.manager.invalidate(followed)
+                    return 0
+
+            self.rows_followed += len(rows)
+            self.anomalies_followed += int((errors > scores.threshold).sum())
+            return len(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.stale:
+                break
+            self.poll()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
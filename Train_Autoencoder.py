@@ -0,0 +1,175 @@
+import os
+import time
+import argparse
+import numpy as np
+from Lazy_Imports import lazy_import
+from Behaviour_Data import DATA_PATH, load_behaviour_data, data_fingerprint, file_fingerprint
+from Scoring_Engine import FEATURES, reconstruction_errors
+from Model_Bundle import MODEL_PATH, ModelBundle, calibrate_threshold
+from Numpy_Autoencoder import export_autoencoder, load_numpy_autoencoder, verify_export
+
+# Only the training entry points need TensorFlow
+tf = lazy_import('tensorflow')
+
+# Matches the shipped model: 6 -> 3 (relu) -> 6 (sigmoid), RMSprop on MSE
+ENCODING_DIM = 3
+LEARNING_RATE = 1e-3
+
+
+def build_autoencoder(n_features, encoding_dim=ENCODING_DIM, learning_rate=LEARNING_RATE):
+    inputs = tf.keras.Input(shape=(n_features,))
+    encoded = tf.keras.layers.Dense(encoding_dim, activation='relu')(inputs)
+    decoded = tf.keras.layers.Dense(n_features, activation='sigmoid')(encoded)
+    autoencoder = tf.keras.Model(inputs, decoded)
+    autoencoder.compile(optimizer=tf.keras.optimizers.RMSprop(learning_rate), loss='mean_squared_error')
+    return autoencoder
+
+
+def split_rows(rows, validation_fraction=0.1, seed=42):
+    """Return (train, validation) row positions from one seeded permutation."""
+    order = np.random.default_rng(seed).permutation(rows)
+    n_validation = int(rows * validation_fraction)
+    return np.sort(order[n_validation:]), np.sort(order[:n_validation])
+
+
+def make_dataset(X, batch_size, shuffle=False, seed=42):
+    """
+    Batch pipeline over a scaled float32 matrix: shuffled with a seeded
+    buffer, batched, paired as (input, target) and prefetched so the next
+    batch is ready while the current step runs.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices(X)
+    if shuffle:
+        dataset = dataset.shuffle(min(len(X), 200_000), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.batch(batch_size).map(lambda x: (x, x), num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+def _throughput_callback(samples_per_epoch):
+    """Keras callback that records wall time and samples/sec of every epoch."""
+
+    class ThroughputLog(tf.keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.epoch_seconds = []
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self._start = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            seconds = time.perf_counter() - self._start
+            self.epoch_seconds.append(seconds)
+            if logs is not None:
+                logs['samples_per_sec'] = samples_per_epoch / seconds
+
+    return ThroughputLog()
+
+
+def fit_autoencoder(autoencoder, X_train, X_validation, epochs=50, batch_size=1024, patience=5, seed=42, verbose=2):
+    """
+    Fit with early stopping on validation loss, keeping the best weights.
+    Returns the Keras history and the per-epoch wall times.
+    """
+    throughput = _throughput_callback(len(X_train))
+    early_stopping = tf.keras.callbacks.EarlyStopping(
+        monitor='val_loss', patience=patience, restore_best_weights=True
+    )
+    history = autoencoder.fit(
+        make_dataset(X_train, batch_size, shuffle=True, seed=seed),
+        validation_data=make_dataset(X_validation, batch_size),
+        epochs=epochs,
+        callbacks=[throughput, early_stopping],
+        verbose=verbose
+    )
+    return history, throughput.epoch_seconds
+
+
+def save_model_atomically(autoencoder, model_path):
+    """Save the model under a temporary name and move it into place in one step."""
+    root, extension = os.path.splitext(model_path)
+    tmp_path = f'{root}.tmp-{os.getpid()}{extension}'
+    autoencoder.save(tmp_path)
+    os.replace(tmp_path, model_path)
+    return model_path
+
+
+def train_model(csv_path=DATA_PATH, model_path=MODEL_PATH, features=FEATURES, epochs=50, batch_size=1024,
+                patience=5, validation_fraction=0.1, percentile=95, reference_days=None, seed=42, verbose=2):
+    """
+    Train the autoencoder from the behaviour log and export everything the
+    scorers need: the .keras model, its NumPy weights and the model bundle
+    with the fitted scaler and calibrated threshold. Returns a report dict.
+    """
+    started = time.perf_counter()
+    tf.keras.utils.set_random_seed(seed)
+    tf.config.experimental.enable_op_determinism()
+
+    # Columns come memory-mapped from the snapshot; only the features are materialised
+    employee_df = load_behaviour_data(csv_path)
+    X = employee_df[features].to_numpy(dtype=np.float64)
+    train_rows, validation_rows = split_rows(len(X), validation_fraction, seed)
+
+    # The scaler is fitted on the training rows only
+    bundle = ModelBundle(features, X[train_rows].min(axis=0), X[train_rows].max(axis=0), threshold=0.0,
+                         percentile=percentile, reference_days=reference_days, trained_rows=len(X))
+    X_scaled = bundle.transform(X).astype(np.float32)
+    prepared = time.perf_counter()
+
+    autoencoder = build_autoencoder(len(features))
+    history, epoch_seconds = fit_autoencoder(
+        autoencoder, X_scaled[train_rows], X_scaled[validation_rows], epochs, batch_size, patience, seed, verbose
+    )
+    trained = time.perf_counter()
+
+    save_model_atomically(autoencoder, model_path)
+    _, npz = export_autoencoder(model_path)
+    numpy_autoencoder = load_numpy_autoencoder(npz)
+    verify_export(autoencoder, numpy_autoencoder, len(features))
+
+    bundle.model_fingerprint = file_fingerprint(model_path)
+    errors = reconstruction_errors(X_scaled, numpy_autoencoder, 65536)
+    threshold = calibrate_threshold(bundle, employee_df, errors, data_fingerprint(csv_path), model_path)
+
+    train_seconds = trained - prepared
+    epochs_run = len(epoch_seconds)
+    return {
+        'rows': len(X),
+        'train_rows': len(train_rows),
+        'validation_rows': len(validation_rows),
+        'epochs_run': epochs_run,
+        'best_val_loss': float(min(history.history['val_loss'])),
+        'threshold': threshold,
+        'samples_per_sec': len(train_rows) * epochs_run / sum(epoch_seconds),
+        'prepare_seconds': prepared - started,
+        'train_seconds': train_seconds,
+        'wall_seconds': time.perf_counter() - started,
+        'model_path': model_path
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the behaviour autoencoder and export its model bundle.")
+    parser.add_argument('csv_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--model', default=MODEL_PATH, help="Where to write the .keras model (bundle and .npz go next to it)")
+    parser.add_argument('--epochs', type=int, default=50)
+    parser.add_argument('--batch-size', type=int, default=1024)
+    parser.add_argument('--patience', type=int, default=5)
+    parser.add_argument('--validation-fraction', type=float, default=0.1)
+    parser.add_argument('--percentile', type=float, default=95)
+    parser.add_argument('--reference-days', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    report = train_model(
+        args.csv_path, args.model, FEATURES, args.epochs, args.batch_size, args.patience,
+        args.validation_fraction, args.percentile, args.reference_days, args.seed
+    )
+    print(f"Trained on {report['train_rows']:,} rows ({report['validation_rows']:,} held out), "
+          f"{report['epochs_run']} epochs, best val_loss {report['best_val_loss']:.6f}")
+    print(f"Throughput: {report['samples_per_sec']:,.0f} samples/s, "
+          f"training {report['train_seconds']:.1f} s, wall time {report['wall_seconds']:.1f} s")
+    print(f"Threshold {report['threshold']:.5f} -> {report['model_path']}")
+
+
+if __name__ == "__main__":
+    main()
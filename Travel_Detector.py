@@ -0,0 +1,175 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from Behaviour_Data import DATA_PATH, load_behaviour_data
+from Employee_Store import EmployeeIndex
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Moving faster than an airliner between two logins is not travel
+MAX_SPEED_KMH = 1000.0
+
+# Location jitter below this distance is never flagged, however short the gap
+MIN_DISTANCE_KM = 50.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between arrays of points given in degrees."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype=np.float64)) for values in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def impossible_travel(distance_km, hours, max_speed_kmh=MAX_SPEED_KMH, min_distance_km=MIN_DISTANCE_KM):
+    """
+    Flag moves that would need more than `max_speed_kmh`. Compared without
+    dividing, so a zero time gap is handled; NaN (no previous session) is
+    never flagged.
+    """
+    return (distance_km > min_distance_km) & (distance_km > max_speed_kmh * hours)
+
+
+def _ns(timestamps):
+    return np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64)
+
+
+def _gap_hours(login_ns, previous_login_ns, previous_logout_ns):
+    """Hours from the previous session's logout (its login if missing) to this login, never negative."""
+    left = np.where(previous_logout_ns == np.iinfo(np.int64).min, previous_login_ns, previous_logout_ns)
+    return np.maximum(login_ns - left, 0) / 3.6e12
+
+
+def session_travel(latitude, longitude, login_ns, logout_ns, order, offsets):
+    """
+    Distance (km) and time (hours) from every session to the same
+    employee's previous one, in one pass over the rows sorted by
+    (employee, login). `order` and `offsets` are laid out as in
+    EmployeeIndex; the other arrays are aligned with the rows.
+
+    Time runs from the previous session's logout, not its login, since the
+    employee was still at the previous location while logged in there; it
+    falls back to the login when the logout is missing, and overlapping
+    sessions count as no time at all. Both results are float32 aligned
+    with the rows, NaN for an employee's first session.
+    """
+    distance = np.full(len(latitude), np.nan, dtype=np.float32)
+    hours = np.full(len(latitude), np.nan, dtype=np.float32)
+
+    # Consecutive sorted rows belong to the same employee unless the second starts a group
+    follows = np.ones(len(order), dtype=bool)
+    follows[offsets[:-1][offsets[:-1] < len(order)]] = False
+    sorted_positions = np.flatnonzero(follows)
+    current, previous = order[sorted_positions], order[sorted_positions - 1]
+
+    distance[current] = haversine_km(latitude[previous], longitude[previous], latitude[current], longitude[current])
+    hours[current] = _gap_hours(login_ns[current], login_ns[previous], logout_ns[previous])
+    return distance, hours
+
+
+def detect_travel(employee_df, index=None):
+    """
+    Return (distance km, hours) since each session's previous session by
+    the same employee. Reuses the sort of an EmployeeIndex built over the
+    frame when given one with no appended rows.
+    """
+    if index is None or index.appended:
+        index = EmployeeIndex(employee_df['Employee_ID'], employee_df['Login_Timestamp'])
+    return session_travel(
+        employee_df['Latitude'].to_numpy(dtype=np.float64),
+        employee_df['Longitude'].to_numpy(dtype=np.float64),
+        _ns(employee_df['Login_Timestamp']), _ns(employee_df['Logout_Timestamp']),
+        index.order, index.offsets
+    )
+
+
+def append_travel(employee_store, new_rows):
+    """
+    Travel for rows about to be appended to `employee_store`: within the
+    batch as above, and from the store's latest session of each employee
+    to their first new session.
+
+    Returns (distance, hours, revised). A new row logged in before the
+    employee's latest stored session is placed in their full history
+    instead, and the stored session that now follows it is measured from
+    it; `revised` holds those sessions as (positions, distance, hours), so
+    the result matches a full detect_travel pass in any arrival order.
+    """
+    codes, employee_ids = pd.factorize(new_rows['Employee_ID'])
+    login, logout = _ns(new_rows['Login_Timestamp']), _ns(new_rows['Logout_Timestamp'])
+    order = np.lexsort((login, codes))
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=len(employee_ids)))])
+    latitude = new_rows['Latitude'].to_numpy(dtype=np.float64)
+    longitude = new_rows['Longitude'].to_numpy(dtype=np.float64)
+    distance, hours = session_travel(latitude, longitude, login, logout, order, offsets)
+
+    latest = [employee_store.index.latest(employee_id) for employee_id in employee_ids]
+    known = np.array([position is not None for position in latest], dtype=bool)
+    late = np.zeros(len(employee_ids), dtype=bool)
+    if known.any():
+        previous = employee_store.take(np.array([position for position in latest if position is not None]))
+        first = order[offsets[:-1][known]]
+        previous_login = _ns(previous['Login_Timestamp'])
+        late[known] = login[first] < previous_login
+        # Rows after the latest stored session only follow on from it
+        on_time = ~late[known]
+        first, previous = first[on_time], previous[on_time]
+        distance[first] = haversine_km(previous['Latitude'], previous['Longitude'], latitude[first], longitude[first])
+        hours[first] = _gap_hours(login[first], previous_login[on_time], _ns(previous['Logout_Timestamp']))
+
+    revised = [], [], []
+    for code in np.flatnonzero(late):
+        rows = order[offsets[code]:offsets[code + 1]]
+        positions = employee_store.index.positions(employee_ids[code])
+        history = employee_store.take(positions)
+        chain_login = np.concatenate([_ns(history['Login_Timestamp']), login[rows]])
+        chain_order = np.argsort(chain_login, kind='stable')
+        chain_distance, chain_hours = session_travel(
+            np.concatenate([history['Latitude'].to_numpy(dtype=np.float64), latitude[rows]]),
+            np.concatenate([history['Longitude'].to_numpy(dtype=np.float64), longitude[rows]]),
+            chain_login, np.concatenate([_ns(history['Logout_Timestamp']), logout[rows]]),
+            chain_order, np.array([0, len(chain_order)])
+        )
+        distance[rows], hours[rows] = chain_distance[len(positions):], chain_hours[len(positions):]
+        # Stored sessions whose predecessor is now one of the new rows
+        successors = chain_order[1:][chain_order[:-1] >= len(positions)]
+        successors = successors[successors < len(positions)]
+        for values, part in zip(revised, (positions[successors], chain_distance[successors], chain_hours[successors])):
+            values.append(part)
+
+    if revised[0]:
+        revised = tuple(np.concatenate(values) for values in revised)
+    else:
+        revised = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.float32)
+    return distance, hours, revised
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Flag physically impossible travel between consecutive sessions.")
+    parser.add_argument('csv_path', nargs='?', default=DATA_PATH)
+    parser.add_argument('--tile', type=int, default=1, help="Repeat the sessions this many times, shifted in time")
+    args = parser.parse_args()
+
+    employee_df = load_behaviour_data(args.csv_path)
+    if args.tile > 1:
+        span = employee_df['Login_Timestamp'].max() - employee_df['Login_Timestamp'].min() + pd.Timedelta(days=1)
+        employee_df = pd.concat(
+            [employee_df.assign(Login_Timestamp=employee_df['Login_Timestamp'] + span * i,
+                                Logout_Timestamp=employee_df['Logout_Timestamp'] + span * i)
+             for i in range(args.tile)],
+            ignore_index=True
+        )
+
+    start = time.perf_counter()
+    index = EmployeeIndex(employee_df['Employee_ID'], employee_df['Login_Timestamp'])
+    indexed = time.perf_counter()
+    distance, hours = detect_travel(employee_df, index)
+    flags = impossible_travel(distance, hours)
+    done = time.perf_counter()
+    print(f"{len(employee_df):,} sessions: sort {indexed - start:.3f} s, travel pass {done - indexed:.3f} s "
+          f"({len(employee_df) / (done - indexed):,.0f} sessions/s)")
+    print(f"{int(flags.sum()):,} impossible moves (> {MAX_SPEED_KMH:,.0f} km/h over > {MIN_DISTANCE_KM:,.0f} km)")
+
+
+if __name__ == "__main__":
+    main()